@@ -5,6 +5,8 @@ Django settings for backend project.
 from pathlib import Path
 import os
 
+from backend.database import databases, read_replicas
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -39,6 +41,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'feed.querybudget.QueryBudgetMiddleware',
 ]
 
 ROOT_URLCONF = 'backend.urls'
@@ -63,13 +66,96 @@ WSGI_APPLICATION = 'backend.wsgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
-DATABASES = {
+# Profile: FEED_DB_PROFILE=sqlite (WAL, persistent connections) or
+# postgres (from DATABASE_URL, persistent or pooled connections); see
+# backend/database.py. The 'replica' alias is unused unless a replica is
+# configured (FEED_REPLICA_DB, a copy of db.sqlite3, or DATABASE_REPLICA_URL).
+DATABASES = databases(BASE_DIR)
+
+# SQLite pragmas set on every new connection (feed.dbprofile)
+FEED_SQLITE_PRAGMAS = {
+    'journal_mode': 'wal',
+    'synchronous': 'normal',
+    'mmap_size': int(os.getenv('FEED_SQLITE_MMAP_SIZE', str(256 * 2 ** 20))),
+    'busy_timeout': 5000,
+    'temp_store': 'memory',
+}
+
+# Safe requests to the post, comment and user endpoints read from these
+# aliases; writes, and reads by a client for FEED_REPLICA_STICKY_SECONDS
+# after it wrote, use 'default'.
+DATABASE_ROUTERS = ['feed.routing.ReplicaRouter']
+FEED_READ_REPLICAS = read_replicas()
+FEED_REPLICA_STICKY_SECONDS = int(os.getenv('FEED_REPLICA_STICKY_SECONDS', '10'))
+
+# Cache
+# The feed response cache can use any Django cache backend. Local memory is
+# per process; point FEED_CACHE_BACKEND at a shared backend (e.g.
+# django.core.cache.backends.filebased.FileBasedCache with a directory in
+# FEED_CACHE_LOCATION) when running several workers.
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'feed': {
+        'BACKEND': os.getenv('FEED_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('FEED_CACHE_LOCATION', 'feed'),
+    },
+}
+
+FEED_CACHE_ALIAS = 'feed'
+FEED_CACHE_TIMEOUT = int(os.getenv('FEED_CACHE_TIMEOUT', '30'))
+FEED_CACHE_ENABLED = os.getenv('FEED_CACHE_ENABLED', 'True') == 'True'
+
+# Build post list/detail JSON straight from values_list() rows instead of
+# the DRF serializers (same output, far less CPU per object)
+FEED_FAST_READS = os.getenv('FEED_FAST_READS', 'True') == 'True'
+
+# Write-behind likes: queue like/unlike requests and apply them in batches
+# with `python manage.py flush_like_events --loop`. When the oldest queued
+# event is older than FEED_LIKE_MAX_LAG seconds, requests fall back to the
+# synchronous path.
+FEED_LIKE_WRITE_BEHIND = os.getenv('FEED_LIKE_WRITE_BEHIND', 'False') == 'True'
+FEED_LIKE_MAX_LAG = float(os.getenv('FEED_LIKE_MAX_LAG', '30'))
+
+# Seconds a shared cache (reverse proxy, CDN) may serve anonymous reads
+FEED_HTTP_MAX_AGE = int(os.getenv('FEED_HTTP_MAX_AGE', '5'))
+
+# Query budgets: the most queries each view action may run, including two
+# for the session and user of a logged-in request. Going over logs a
+# warning, or raises with FEED_QUERY_BUDGET_MODE=raise; 'off' disables the
+# tracking.
+FEED_QUERY_BUDGET_MODE = os.getenv('FEED_QUERY_BUDGET_MODE', 'log')
+FEED_QUERY_BUDGETS = {
+    'PostViewSet.list': 7,
+    'PostViewSet.retrieve': 7,
+    'PostViewSet.comments': 8,
+    'CommentViewSet.list': 7,
+    'CommentViewSet.retrieve': 8,
+    'UserViewSet.leaderboard': 6,
+    'SearchViewSet.list': 8,
 }
 
+# Live updates (/api/events/): LocalBroker only reaches subscribers in the
+# same process; with several workers use feed.events.CacheBroker and a shared
+# FEED_CACHE_BACKEND. FEED_EVENTS_BUFFER bounds each subscriber's backlog.
+FEED_EVENTS_BACKEND = os.getenv('FEED_EVENTS_BACKEND', 'feed.events.LocalBroker')
+FEED_EVENTS_BUFFER = int(os.getenv('FEED_EVENTS_BUFFER', '100'))
+FEED_EVENTS_HEARTBEAT = int(os.getenv('FEED_EVENTS_HEARTBEAT', '15'))
+FEED_EVENTS_MAX_SECONDS = int(os.getenv('FEED_EVENTS_MAX_SECONDS', '300'))
+FEED_EVENTS_RETENTION = int(os.getenv('FEED_EVENTS_RETENTION', '60'))
+FEED_EVENTS_POLL_INTERVAL = float(os.getenv('FEED_EVENTS_POLL_INTERVAL', '0.5'))
+
+# Karma transactions older than this many days are folded into daily
+# summaries by `python manage.py compact_karma`.
+FEED_KARMA_COMPACT_AFTER_DAYS = int(os.getenv('FEED_KARMA_COMPACT_AFTER_DAYS', '30'))
+
+# liked_by_me flags cost one query per response; with FEED_LIKED_CACHE each
+# viewer's liked ids are cached instead (FEED_LIKED_CACHE_TIMEOUT seconds)
+# until they like or unlike something.
+FEED_LIKED_CACHE = os.getenv('FEED_LIKED_CACHE', 'False') == 'True'
+FEED_LIKED_CACHE_TIMEOUT = int(os.getenv('FEED_LIKED_CACHE_TIMEOUT', '300'))
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
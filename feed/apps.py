@@ -1,5 +1,22 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_migrate
 
 
 class FeedConfig(AppConfig):
     name = 'feed'
+
+    def ready(self):
+        from .dbprofile import configure_connection
+
+        connection_created.connect(configure_connection, dispatch_uid='feed.dbprofile')
+        post_migrate.connect(restore_search_triggers, sender=self, dispatch_uid='feed.search')
+
+
+def restore_search_triggers(sender, using, verbosity=1, **kwargs):
+    """After ``migrate``, re-create the SQLite search triggers a table rebuild dropped."""
+    from .search import restore_triggers
+
+    restored = restore_triggers(using)
+    if restored and verbosity:
+        print(f"Restored search triggers {', '.join(sorted(restored))}; run rebuild_search_index to catch up")
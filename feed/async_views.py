@@ -0,0 +1,137 @@
+"""Async read endpoints for ASGI workers.
+
+The post list, post detail, comment thread and leaderboard, with the same
+JSON as the DRF viewsets (the post detail shares their response cache
+entries), built with the async ORM so a worker waiting on the database or
+on a slow client holds a coroutine instead of a thread. Serve them with an
+ASGI server, e.g. ``gunicorn backend.asgi:application -k
+uvicorn.workers.UvicornWorker``.
+"""
+from types import SimpleNamespace
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+from django.views.decorators.http import require_safe
+from rest_framework.exceptions import NotFound
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+
+from . import cache as response_cache
+from . import events
+from . import fastpath
+from . import liked
+from . import ranking
+from .conditional import aconditional, scope_validators
+from .leaderboard import top_user_ids, validators as leaderboard_validators
+from .models import Post, Comment, subtree_range
+from .pagination import KeysetPagination
+from .routing import STICKY_COOKIE, replica_reads
+from .views import PostViewSet
+
+_renderer = JSONRenderer()
+
+
+def json_response(data, status=200):
+    return HttpResponse(_renderer.render(data), status=status, content_type='application/json')
+
+
+def not_found(message='Not found.'):
+    return json_response({'detail': message}, status=404)
+
+
+def replica_safe(request):
+    """Replica routing for a read, as ``ReplicaReadsMixin`` does for the viewsets."""
+    return replica_reads(STICKY_COOKIE not in request.COOKIES)
+
+
+@require_safe
+@aconditional(lambda request: ranking.validators(request.GET))
+async def post_list(request):
+    try:
+        ordering, since = ranking.feed_order(request.GET)
+    except ValueError as exc:
+        return json_response({'error': str(exc)}, status=400)
+    queryset = Post.objects.filter(created_at__gte=since) if since else Post.objects.all()
+    paginator = KeysetPagination()
+    view = SimpleNamespace(keyset_ordering=ordering)
+
+    async def build():
+        if since:
+            keys = await ranking.awindow_keys(Post.objects.all(), since)
+            posts = await paginator.apaginate_ranked(keys, fastpath.post_rows(queryset), Request(request), view)
+        else:
+            posts = await paginator.apaginate_queryset(fastpath.post_rows(queryset), Request(request), view)
+        results = await fastpath.arender_post_list(posts, PostViewSet.comment_preview_size)
+        return {'next': paginator.get_next_link(), 'results': results}
+
+    key = response_cache.resource_key('post-list', request.build_absolute_uri(), since)
+    with replica_safe(request):
+        try:
+            data = await response_cache.aget_or_build(key, response_cache.get_version('feed'), build)
+        except NotFound as exc:
+            return not_found(str(exc.detail))
+        viewer_id = liked.viewer_id(await request.auser())
+        results = await liked.aflag(viewer_id, data['results'], 'post')
+    return json_response({**data, 'results': results})
+
+
+@require_safe
+@aconditional(lambda request, pk: scope_validators(f'post:{pk}'))
+async def post_detail(request, pk):
+    async def build():
+        data = await fastpath.arender_post_detail(pk)
+        if data is None:
+            raise NotFound()
+        return data
+
+    key = response_cache.resource_key('post-detail', pk)
+    with replica_safe(request):
+        try:
+            data = await response_cache.aget_or_build(key, response_cache.get_version(f'post:{pk}'), build)
+        except NotFound as exc:
+            return not_found(str(exc.detail))
+        data = (await liked.aflag(liked.viewer_id(await request.auser()), [data], 'post'))[0]
+    return json_response(data)
+
+
+@require_safe
+@aconditional(lambda request, pk: scope_validators(f'post:{pk}'))
+async def post_thread(request, pk):
+    """A post's whole comment thread, or everything below ``?parent=``, as nested JSON."""
+    with replica_safe(request):
+        if not await Post.objects.filter(pk=pk).aexists():
+            return not_found()
+        comments = Comment.objects.filter(post_id=pk)
+        if request.GET.get('parent'):
+            try:
+                parent_id = int(request.GET['parent'])
+            except ValueError:
+                return json_response({'error': 'parent must be an integer'}, status=400)
+            parent = await Comment.objects.filter(pk=parent_id, post_id=pk).values('path', 'depth').afirst()
+            if parent is None:
+                return not_found('Comment not found')
+            comments = comments.filter(subtree_range(parent['path']), depth__gt=parent['depth'])
+        rows = await fastpath.acomment_rows(comments.order_by('path'))
+        authors = await fastpath.aload_authors({row[1] for row in rows})
+        thread = fastpath.build_comments(rows, authors).get(pk, [])
+        thread = await liked.aflag(liked.viewer_id(await request.auser()), thread, 'comment')
+    return json_response(thread)
+
+
+@require_safe
+@aconditional(lambda request: leaderboard_validators())
+async def leaderboard(request):
+    with replica_safe(request):
+        # Sliding the window writes in a transaction, which the async ORM
+        # cannot do; it runs on the sync thread.
+        top_ids = await sync_to_async(top_user_ids)()
+        authors = await fastpath.aload_authors(top_ids)
+    return json_response([authors[user_id] for user_id in top_ids if user_id in authors])
+
+
+@require_safe
+async def event_stream(request):
+    channels = events.requested_channels(request.GET)
+    if channels is None:
+        return json_response({'error': 'channel must be feed, leaderboard or post:<id>'}, status=400)
+    return events.response(events.astream(channels))
@@ -0,0 +1,180 @@
+"""Versioned response cache for the feed and post detail.
+
+Every cacheable resource belongs to a scope (``'feed'`` for the post list,
+``'post:<id>'`` for one post) whose version is bumped on writes. A cached
+entry records the version it was built at and is only served fresh while
+that version is current and its TTL has not run out.
+
+Author karma embedded in a cached post is not versioned and may lag by up
+to ``FEED_CACHE_TIMEOUT`` seconds.
+
+To avoid a stampede when an entry goes stale, the first request takes a
+short lock and rebuilds it while concurrent requests are served the stale
+copy. When there is no copy at all they wait briefly for the rebuild.
+
+The backend is whatever Django cache ``FEED_CACHE_ALIAS`` names. The default
+local-memory cache is per process, so with several workers use a shared
+backend (file, memcached, redis) for invalidation to reach all of them.
+
+With read replicas, an entry built from a lagging replica can miss a write
+until the next bump or its TTL; clients pinned to the primary after a write
+(``feed.routing``) bypass the cache.
+"""
+import asyncio
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+from . import routing
+
+LOCK_TIMEOUT = 10
+WAIT_TIMEOUT = 2.0
+WAIT_INTERVAL = 0.05
+
+
+def get_cache():
+    return caches[getattr(settings, 'FEED_CACHE_ALIAS', 'default')]
+
+
+def enabled():
+    return getattr(settings, 'FEED_CACHE_ENABLED', True)
+
+
+def _version_key(scope):
+    return f'feed:version:{scope}'
+
+
+def get_version(scope):
+    cache = get_cache()
+    key = _version_key(scope)
+    version = cache.get(key)
+    if version is None:
+        # Seed from the clock so a version lost to eviction never repeats one
+        # that cached entries were built at.
+        cache.add(key, time.time_ns() // 1000, None)
+        version = cache.get(key)
+    return version
+
+
+def _modified_key(scope):
+    return f'feed:modified:{scope}'
+
+
+def get_modified(scope):
+    """Unix time of the last bump of ``scope`` (or of the first read after it was evicted)."""
+    cache = get_cache()
+    key = _modified_key(scope)
+    modified = cache.get(key)
+    if modified is None:
+        cache.add(key, time.time(), None)
+        modified = cache.get(key)
+    return modified
+
+
+def _bump(scopes):
+    cache = get_cache()
+    now = time.time()
+    for scope in scopes:
+        key = _version_key(scope)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, time.time_ns() // 1000, None)
+        cache.set(_modified_key(scope), now, None)
+
+
+def bump(*scopes):
+    """Invalidate ``scopes`` now and again once the current transaction commits.
+
+    The second bump retires anything rebuilt from the pre-commit state by a
+    reader that raced the write.
+    """
+    _bump(scopes)
+    transaction.on_commit(lambda: _bump(scopes))
+
+
+def post_scopes(post_id):
+    return ('feed', f'post:{post_id}')
+
+
+def liked_scope(user_id):
+    """Scope of the ids ``user_id`` has liked (see ``feed.liked``)."""
+    return f'liked:{user_id}'
+
+
+def resource_key(name, *parts):
+    digest = hashlib.sha1('|'.join(str(part) for part in parts).encode()).hexdigest()
+    return f'feed:response:{name}:{digest}'
+
+
+def get_or_build(key, version, build, timeout=None):
+    """Return the payload cached under ``key`` for ``version``, building it with ``build()`` if needed."""
+    if not enabled():
+        return build()
+    if routing.is_sticky():
+        # Entries may have been built from a lagging replica; a client that
+        # just wrote reads the primary directly.
+        return build()
+
+    cache = get_cache()
+    timeout = timeout or getattr(settings, 'FEED_CACHE_TIMEOUT', 30)
+    entry = cache.get(key)
+    if entry is not None and entry[0] == version and entry[1] > time.time():
+        return entry[2]
+
+    lock_key = f'{key}:lock'
+    if cache.add(lock_key, 1, LOCK_TIMEOUT):
+        try:
+            payload = build()
+            # Keep the entry around past its TTL so it can be served stale
+            # while the next rebuild is in flight.
+            cache.set(key, (version, time.time() + timeout, payload), timeout * 10)
+            return payload
+        finally:
+            cache.delete(lock_key)
+
+    if entry is not None:
+        return entry[2]
+
+    deadline = time.time() + WAIT_TIMEOUT
+    while time.time() < deadline:
+        time.sleep(WAIT_INTERVAL)
+        entry = cache.get(key)
+        if entry is not None and entry[0] == version:
+            return entry[2]
+    return build()
+
+
+async def aget_or_build(key, version, build, timeout=None):
+    """``get_or_build`` for an async ``build()``, using the cache's async API."""
+    if not enabled() or routing.is_sticky():
+        return await build()
+
+    cache = get_cache()
+    timeout = timeout or getattr(settings, 'FEED_CACHE_TIMEOUT', 30)
+    entry = await cache.aget(key)
+    if entry is not None and entry[0] == version and entry[1] > time.time():
+        return entry[2]
+
+    lock_key = f'{key}:lock'
+    if await cache.aadd(lock_key, 1, LOCK_TIMEOUT):
+        try:
+            payload = await build()
+            await cache.aset(key, (version, time.time() + timeout, payload), timeout * 10)
+            return payload
+        finally:
+            await cache.adelete(lock_key)
+
+    if entry is not None:
+        return entry[2]
+
+    deadline = time.time() + WAIT_TIMEOUT
+    while time.time() < deadline:
+        await asyncio.sleep(WAIT_INTERVAL)
+        entry = await cache.aget(key)
+        if entry is not None and entry[0] == version:
+            return entry[2]
+    return await build()
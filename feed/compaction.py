@@ -0,0 +1,75 @@
+"""Compaction of the karma ledger.
+
+Lifetime totals and the leaderboard are read from the rollups
+(``UserKarma``, ``KarmaBucket``, ``WindowKarma``), never from
+``KarmaTransaction``, so the ledger only needs to stay itemized for recent
+activity. ``compact()`` folds the rows created before the start of the UTC
+day ``FEED_KARMA_COMPACT_AFTER_DAYS`` days ago into ``KarmaDailySummary``
+(one row per user, day and source type) and deletes them.
+
+The rollups already include that karma and are left alone, so totals and
+the leaderboard read the same before and after. For every user, the ledger
+plus their summaries still add up to ``UserKarma.total``.
+
+Rows are taken in id order, ``chunk_size`` at a time, one short transaction
+per chunk, so no lock is held for longer than one chunk takes.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .export import fields_of
+from .models import KarmaTransaction, KarmaDailySummary
+
+CHUNK_SIZE = 1000
+# Anything newer than a day may still be in the leaderboard window.
+MIN_DAYS = 1
+
+
+def cutoff(days=None, now=None):
+    """Start of the UTC day ``days`` days before ``now``; older rows are compacted."""
+    if days is None:
+        days = getattr(settings, 'FEED_KARMA_COMPACT_AFTER_DAYS', 30)
+    if days < MIN_DAYS:
+        raise ValueError(f'Karma can only be compacted after at least {MIN_DAYS} day(s)')
+    moment = (now or timezone.now()) - timedelta(days=days)
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def pending(before):
+    return KarmaTransaction.objects.filter(created_at__lt=before)
+
+
+def summarize(rows):
+    """``{(user_id, day, source_type): [karma, transactions]}`` for ledger ``rows``."""
+    summaries = {}
+    for row in rows:
+        key = (row['user_id'], row['created_at'].date(), row['source_type'])
+        summary = summaries.setdefault(key, [0, 0])
+        summary[0] += row['karma']
+        summary[1] += 1
+    return summaries
+
+
+def compact(before, chunk_size=CHUNK_SIZE, archive=None):
+    """Fold the ledger rows created before ``before`` into daily summaries.
+
+    Yields the number of rows compacted after each chunk. ``archive``, if
+    given, is called with each chunk's rows (as dicts of every column)
+    before they are deleted.
+    """
+    queryset = pending(before).order_by('id')
+    while True:
+        with transaction.atomic():
+            # Locked, so two jobs running at once cannot fold a row twice.
+            rows = list(queryset.select_for_update().values(*fields_of(KarmaTransaction))[:chunk_size])
+            if not rows:
+                return
+            if archive is not None:
+                archive(rows)
+            for (user_id, day, source_type), (karma, count) in summarize(rows).items():
+                KarmaDailySummary.add(user_id, day, source_type, karma, count)
+            KarmaTransaction.objects.filter(id__in=[row['id'] for row in rows]).delete()
+        yield len(rows)
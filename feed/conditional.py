@@ -0,0 +1,94 @@
+"""Conditional GET support for the read endpoints.
+
+Validators are derived from the scope versions kept by ``feed.cache``, so a
+poll that matches ``If-None-Match`` / ``If-Modified-Since`` is answered with
+304 before any queryset is evaluated. A logged-in viewer's ETag also names
+them, since their responses carry their own ``liked_by_me`` flags.
+"""
+import math
+from functools import wraps
+
+from django.conf import settings
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+
+from . import cache
+
+
+def scope_validators(*scopes, extra=(), not_before=0):
+    """ETag and Last-Modified for a response that depends on ``scopes``.
+
+    ``extra`` adds parts to the ETag for state not tracked by a scope, and
+    ``not_before`` is the time that state last changed.
+    """
+    parts = [str(cache.get_version(scope)) for scope in scopes]
+    parts.extend(str(part) for part in extra)
+    last_modified = max(not_before, *(cache.get_modified(scope) for scope in scopes))
+    return '"%s"' % '-'.join(parts), last_modified
+
+
+def conditional(get_validators):
+    """Decorate a viewset action with conditional GET handling.
+
+    ``get_validators(view, request, *args, **kwargs)`` returns ``(etag,
+    last_modified)`` or ``None`` when the resource cannot be validated
+    cheaply. Anonymous responses are marked cacheable by shared caches.
+    """
+    def decorator(method):
+        @wraps(method)
+        def wrapper(self, request, *args, **kwargs):
+            validators = get_validators(self, request, *args, **kwargs)
+            if validators is None:
+                return method(self, request, *args, **kwargs)
+
+            user = request.user
+            etag, last_modified = _normalize(validators, user)
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if response is None:
+                response = method(self, request, *args, **kwargs)
+                if response.status_code != 200:
+                    return response
+            return _finish(user, response, etag, last_modified)
+        return wrapper
+    return decorator
+
+
+def aconditional(get_validators):
+    """``conditional`` for async function views; ``get_validators(request, *args, **kwargs)``."""
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            user = await request.auser()
+            etag, last_modified = _normalize(get_validators(request, *args, **kwargs), user)
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if response is None:
+                response = await view(request, *args, **kwargs)
+                if response.status_code != 200:
+                    return response
+            return _finish(user, response, etag, last_modified)
+        return wrapper
+    return decorator
+
+
+def _normalize(validators, user):
+    etag, last_modified = validators
+    if user and user.is_authenticated:
+        etag = '%s-u%s"' % (etag[:-1], user.pk)
+    # HTTP dates have one-second resolution; round up so a change later in
+    # the same second still counts as modified.
+    return etag, math.ceil(last_modified)
+
+
+def _finish(user, response, etag, last_modified):
+    response.headers['ETag'] = etag
+    response.headers['Last-Modified'] = http_date(last_modified)
+    _set_cache_control(user, response)
+    return response
+
+
+def _set_cache_control(user, response):
+    if user and user.is_authenticated:
+        patch_cache_control(response, private=True, no_cache=True)
+    else:
+        patch_cache_control(response, public=True, max_age=getattr(settings, 'FEED_HTTP_MAX_AGE', 5))
+    patch_vary_headers(response, ['Cookie', 'Authorization'])
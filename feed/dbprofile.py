@@ -0,0 +1,18 @@
+"""Per-connection database tuning.
+
+SQLite reads its pragmas from ``FEED_SQLITE_PRAGMAS`` every time Django
+opens a connection. With WAL, readers no longer block the writer (and vice
+versa), and ``synchronous=normal`` skips the fsync on every commit that WAL
+makes unnecessary. Connection and pooling options for both backends live in
+``backend/database.py``.
+"""
+from django.conf import settings
+
+
+def configure_connection(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    # On the raw connection, so the pragmas don't count as the first
+    # request's queries (see feed.querybudget).
+    for name, value in getattr(settings, 'FEED_SQLITE_PRAGMAS', {}).items():
+        connection.connection.execute(f'PRAGMA {name} = {value}')
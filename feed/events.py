@@ -0,0 +1,314 @@
+"""Live updates over server-sent events.
+
+Writes publish compact deltas once their transaction commits:
+
+* ``{"type": "like", "post": 1, "comment": null, "delta": 1}`` to ``feed`` and ``post:<id>``
+* ``{"type": "comment", "post": 1, "id": 7, "parent": 3}`` to ``feed`` and ``post:<id>``
+* ``{"type": "karma", "user": 2, "delta": 5}`` to ``leaderboard``
+
+and the ``events`` endpoints relay them to subscribers as ``text/event-stream``.
+
+Each subscriber gets a buffer of at most ``FEED_EVENTS_BUFFER`` events.
+Publishing never waits on a subscriber: when a slow client's buffer is full
+its oldest event is dropped, and the client is sent an ``overflow`` event
+telling it to refetch instead of applying deltas.
+
+``FEED_EVENTS_BACKEND`` names the broker. ``LocalBroker`` only reaches
+subscribers in the same process. ``CacheBroker`` appends events to the
+shared Django cache (see ``feed.cache``), where one poller thread per
+process picks them up, so it works across workers given a shared backend.
+"""
+import asyncio
+import json
+import logging
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+from django.db import transaction
+from django.http import StreamingHttpResponse
+from django.utils.module_loading import import_string
+
+from . import cache
+
+logger = logging.getLogger(__name__)
+
+CHANNELS = ('feed', 'leaderboard')
+
+
+def valid_channel(name):
+    if name in CHANNELS:
+        return True
+    kind, _, post_id = name.partition(':')
+    return kind == 'post' and post_id.isdigit()
+
+
+def requested_channels(query):
+    """The channels in ``?channel=`` (repeated or comma-separated), ``['feed']`` by default.
+
+    ``None`` if any of them is not a valid channel.
+    """
+    channels = [name for value in query.getlist('channel') for name in value.split(',') if name] or ['feed']
+    if not all(valid_channel(name) for name in channels):
+        return None
+    return list(dict.fromkeys(channels))
+
+
+def response(body):
+    streaming = StreamingHttpResponse(body, content_type='text/event-stream')
+    streaming.headers['Cache-Control'] = 'no-cache'
+    # Stop nginx from buffering the stream.
+    streaming.headers['X-Accel-Buffering'] = 'no'
+    return streaming
+
+
+class Subscription:
+    """A bounded buffer of events for one subscriber."""
+
+    def __init__(self, channels, size):
+        self.channels = tuple(channels)
+        self.buffer = deque(maxlen=size)
+        self.dropped = 0
+        self.condition = threading.Condition()
+        self.waiters = set()
+
+    def push(self, event):
+        with self.condition:
+            if len(self.buffer) == self.buffer.maxlen:
+                self.dropped += 1
+            self.buffer.append(event)
+            self.condition.notify()
+            waiters = list(self.waiters)
+        for loop, ready in waiters:
+            loop.call_soon_threadsafe(ready.set)
+
+    def drain(self):
+        """The buffered events, preceded by an ``overflow`` event if any were dropped."""
+        with self.condition:
+            events = list(self.buffer)
+            self.buffer.clear()
+            if self.dropped:
+                events.insert(0, {'type': 'overflow', 'dropped': self.dropped})
+                self.dropped = 0
+        return events
+
+    def get(self, timeout):
+        """Wait up to ``timeout`` seconds for events; returns them (or ``[]``)."""
+        with self.condition:
+            if not self.buffer and not self.dropped:
+                self.condition.wait(timeout)
+        return self.drain()
+
+    async def aget(self, timeout):
+        """``get()`` for async code, waiting without holding a thread."""
+        waiter = (asyncio.get_running_loop(), asyncio.Event())
+        with self.condition:
+            if self.buffer or self.dropped:
+                return self.drain()
+            self.waiters.add(waiter)
+        try:
+            await asyncio.wait_for(waiter[1].wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with self.condition:
+                self.waiters.discard(waiter)
+        return self.drain()
+
+
+class LocalBroker:
+    """Fans events out to the subscribers in this process."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscribers = {}
+
+    def subscribe(self, channels, size=None):
+        subscription = Subscription(channels, size or getattr(settings, 'FEED_EVENTS_BUFFER', 100))
+        with self.lock:
+            for channel in subscription.channels:
+                self.subscribers.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            for channel in subscription.channels:
+                subscribers = self.subscribers.get(channel, set())
+                subscribers.discard(subscription)
+                if not subscribers:
+                    self.subscribers.pop(channel, None)
+
+    def publish(self, channel, event):
+        self.deliver(channel, [event])
+
+    def deliver(self, channel, events):
+        with self.lock:
+            subscribers = list(self.subscribers.get(channel, ()))
+        for subscription in subscribers:
+            for event in events:
+                subscription.push(event)
+
+
+class CacheBroker(LocalBroker):
+    """Relays events between workers through the shared Django cache.
+
+    Each channel is a sequence counter plus one cache entry per event, kept
+    for ``FEED_EVENTS_RETENTION`` seconds. A poller thread reads the new
+    entries of every channel that has local subscribers each
+    ``FEED_EVENTS_POLL_INTERVAL`` seconds; entries that expired before it
+    got to them are reported to subscribers as dropped.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.positions = {}
+        self.poll_lock = threading.Lock()
+        self.poller = None
+
+    @staticmethod
+    def _sequence_key(channel):
+        return f'feed:events:{channel}'
+
+    def subscribe(self, channels, size=None):
+        subscription = super().subscribe(channels, size)
+        with self.poll_lock:
+            for channel in subscription.channels:
+                if channel not in self.positions:
+                    self.positions[channel] = cache.get_cache().get(self._sequence_key(channel), 0)
+            if self.poller is None:
+                self.poller = threading.Thread(target=self.run, name='feed-events-poller', daemon=True)
+                self.poller.start()
+        return subscription
+
+    def publish(self, channel, event):
+        store = cache.get_cache()
+        key = self._sequence_key(channel)
+        store.add(key, 0, None)
+        sequence = store.incr(key)
+        store.set(f'{key}:{sequence}', event, getattr(settings, 'FEED_EVENTS_RETENTION', 60))
+
+    def poll(self):
+        """Deliver events published since the last poll to local subscribers."""
+        store = cache.get_cache()
+        with self.poll_lock:
+            with self.lock:
+                channels = list(self.subscribers)
+            for channel in list(self.positions):
+                if channel not in channels:
+                    del self.positions[channel]
+            for channel in channels:
+                key = self._sequence_key(channel)
+                last = self.positions.get(channel, 0)
+                latest = store.get(key, 0)
+                if latest <= last:
+                    # Behind us only if the counter was evicted; start over.
+                    self.positions[channel] = latest
+                    continue
+                keys = [f'{key}:{sequence}' for sequence in range(last + 1, latest + 1)]
+                found = store.get_many(keys)
+                events = [found[key] for key in keys if key in found]
+                self.deliver(channel, events)
+                if len(events) < len(keys):
+                    with self.lock:
+                        subscribers = list(self.subscribers.get(channel, ()))
+                    for subscription in subscribers:
+                        with subscription.condition:
+                            subscription.dropped += len(keys) - len(events)
+                self.positions[channel] = latest
+
+    def run(self):
+        while True:
+            time.sleep(getattr(settings, 'FEED_EVENTS_POLL_INTERVAL', 0.5))
+            try:
+                self.poll()
+            except Exception:
+                logger.exception('Polling the event cache failed')
+
+
+_brokers = {}
+_brokers_lock = threading.Lock()
+
+
+def get_broker():
+    path = getattr(settings, 'FEED_EVENTS_BACKEND', 'feed.events.LocalBroker')
+    with _brokers_lock:
+        if path not in _brokers:
+            _brokers[path] = import_string(path)()
+        return _brokers[path]
+
+
+def _publish(channels, event):
+    broker = get_broker()
+    for channel in channels:
+        broker.publish(channel, event)
+
+
+def publish(channels, event):
+    """Publish ``event`` to ``channels`` once the current transaction commits."""
+    # robust: a broker failure is logged rather than failing the request
+    # whose data is already committed.
+    transaction.on_commit(lambda: _publish(channels, event), robust=True)
+
+
+def like_changed(post_id, comment_id, delta):
+    publish(cache.post_scopes(post_id), {'type': 'like', 'post': post_id, 'comment': comment_id, 'delta': delta})
+
+
+def comment_created(comment):
+    publish(
+        cache.post_scopes(comment.post_id),
+        {'type': 'comment', 'post': comment.post_id, 'id': comment.pk, 'parent': comment.parent_id}
+    )
+
+
+def karma_changed(totals):
+    """``totals`` maps user ids to the karma they just gained (or lost)."""
+    for user_id, karma in totals.items():
+        publish(('leaderboard',), {'type': 'karma', 'user': user_id, 'delta': karma})
+
+
+def format_event(event):
+    return f"event: {event['type']}\ndata: {json.dumps(event, separators=(',', ':'))}\n\n".encode()
+
+
+HEARTBEAT = b': keepalive\n\n'
+
+
+def _limits():
+    return (
+        getattr(settings, 'FEED_EVENTS_HEARTBEAT', 15),
+        time.monotonic() + getattr(settings, 'FEED_EVENTS_MAX_SECONDS', 300),
+    )
+
+
+def stream(channels):
+    """The ``text/event-stream`` body for a subscriber to ``channels``.
+
+    Ends after ``FEED_EVENTS_MAX_SECONDS`` (browsers reconnect on their
+    own), so a dead connection holds its worker thread for a bounded time.
+    """
+    broker = get_broker()
+    heartbeat, deadline = _limits()
+    subscription = broker.subscribe(channels)
+    try:
+        yield b'retry: 3000\n\n'
+        while time.monotonic() < deadline:
+            events = subscription.get(heartbeat)
+            yield b''.join(format_event(event) for event in events) if events else HEARTBEAT
+    finally:
+        broker.unsubscribe(subscription)
+
+
+async def astream(channels):
+    """``stream()`` for ASGI, waiting in the event loop."""
+    broker = get_broker()
+    heartbeat, deadline = _limits()
+    subscription = broker.subscribe(channels)
+    try:
+        yield b'retry: 3000\n\n'
+        while time.monotonic() < deadline:
+            events = await subscription.aget(heartbeat)
+            yield b''.join(format_event(event) for event in events) if events else HEARTBEAT
+    finally:
+        broker.unsubscribe(subscription)
@@ -0,0 +1,55 @@
+"""Newline-delimited JSON export of the feed tables.
+
+Each table is read in primary-key order, one ``id > last_id`` query per
+chunk, so memory stays flat however many rows there are and no cursor or
+transaction is held open between chunks. Rows inserted while an export runs
+are included if their id is past the current chunk.
+"""
+import zlib
+
+from .models import Post, Comment, Like, KarmaTransaction, KarmaDailySummary
+from .streaming import dumps
+
+CHUNK_SIZE = 5000
+
+MODELS = {
+    'posts': Post,
+    'comments': Comment,
+    'likes': Like,
+    'karma': KarmaTransaction,
+    'karma_daily': KarmaDailySummary,
+}
+
+
+def fields_of(model):
+    """Column names of ``model``, with foreign keys as ``<name>_id``."""
+    return [field.attname for field in model._meta.concrete_fields]
+
+
+def iter_chunks(model, chunk_size=CHUNK_SIZE):
+    """Rows of ``model`` as lists of dicts, in id order."""
+    queryset = model.objects.order_by('pk').values(*fields_of(model))
+    last_id = None
+    while True:
+        chunk = queryset.filter(pk__gt=last_id) if last_id is not None else queryset
+        rows = list(chunk[:chunk_size])
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1][model._meta.pk.attname]
+
+
+def iter_ndjson(name, chunk_size=CHUNK_SIZE):
+    """Encode the ``name`` table as NDJSON, one piece per chunk of rows."""
+    for rows in iter_chunks(MODELS[name], chunk_size):
+        yield b''.join(dumps(row) + b'\n' for row in rows)
+
+
+def gzipped(pieces, level=6):
+    """Gzip a stream of byte strings as it is produced."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for piece in pieces:
+        compressed = compressor.compress(piece)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
@@ -0,0 +1,192 @@
+"""Fast read path for the post list and post detail.
+
+Builds the same JSON as ``PostSerializer``/``CommentSerializer``/
+``UserSerializer`` straight from ``values_list`` tuples, skipping model
+instantiation and the per-object DRF field machinery. Any change to those
+serializers' fields must be mirrored here; ``FastPathParityTests`` guards
+the two against drifting apart. The ``a``-prefixed functions are the async
+ORM equivalents used by ``feed.async_views``.
+"""
+from django.db.models import F, Sum, Window
+from django.db.models.functions import RowNumber
+from django.contrib.auth.models import User
+from rest_framework import serializers
+
+from .models import Post, Comment, KarmaBucket
+
+POST_FIELDS = ('id', 'title', 'content', 'author_id', 'created_at', 'likes_count', 'comments_count')
+# Not serialized; the keyset paginator reads it for ?sort=hot.
+RANKING_FIELDS = ('hot_score',)
+COMMENT_FIELDS = (
+    'id', 'author_id', 'content', 'created_at', 'likes_count', 'replies_count', 'parent_id', 'post_id'
+)
+
+_datetime = serializers.DateTimeField()
+
+
+def format_datetime(value):
+    return _datetime.to_representation(value)
+
+
+def author_queries(user_ids):
+    window_start = KarmaBucket.window_start()
+    daily = (
+        KarmaBucket.objects.filter(user_id__in=user_ids, hour__gte=window_start)
+        .order_by()
+        .values('user_id')
+        .annotate(total=Sum('karma'))
+        .values_list('user_id', 'total')
+    )
+    users = User.objects.filter(id__in=user_ids).values_list('id', 'username', 'karma__total')
+    return daily, users
+
+
+def build_authors(daily, users):
+    daily = dict(daily)
+    return {
+        user_id: {
+            'id': user_id,
+            'username': username,
+            'total_karma': total or 0,
+            'daily_karma': daily.get(user_id) or 0,
+        }
+        for user_id, username, total in users
+    }
+
+
+def load_authors(user_ids):
+    """UserSerializer output for ``user_ids``, keyed by id, in two queries."""
+    if not user_ids:
+        return {}
+    daily, users = author_queries(user_ids)
+    return build_authors(daily, users)
+
+
+async def aload_authors(user_ids):
+    if not user_ids:
+        return {}
+    daily, users = author_queries(user_ids)
+    return build_authors([row async for row in daily], [row async for row in users])
+
+
+def comment_rows(queryset):
+    return list(queryset.values_list(*COMMENT_FIELDS))
+
+
+async def acomment_rows(queryset):
+    return [row async for row in queryset.values_list(*COMMENT_FIELDS)]
+
+
+def preview_comments(post_ids, size):
+    """The first ``size`` top-level comments of each post, in no particular order.
+
+    Sort the rows with ``sorted()``: a top-level comment's path is its
+    zero-padded id, so id order is thread order. Sorting the few rows here
+    spares the database a temporary B-tree over the window query's output.
+    """
+    return Comment.objects.filter(post_id__in=post_ids, parent=None).annotate(
+        rank=Window(RowNumber(), partition_by=[F('post_id')], order_by=F('path').asc())
+    ).filter(rank__lte=size).order_by()
+
+
+def preview_comment_rows(post_ids, size):
+    return sorted(comment_rows(preview_comments(post_ids, size)))
+
+
+def comment_node(row, authors):
+    """Serialize one ``COMMENT_FIELDS`` row, with an empty ``replies`` list."""
+    comment_id, author_id, content, created_at, likes_count, replies_count, parent_id, post_id = row
+    return {
+        'id': comment_id,
+        'author': authors[author_id],
+        'content': content,
+        'created_at': format_datetime(created_at),
+        'likes_count': likes_count,
+        'replies_count': replies_count,
+        'parent': parent_id,
+        'post': post_id,
+        # Per viewer; see feed.liked.
+        'liked_by_me': False,
+        'replies': [],
+    }
+
+
+def build_comments(rows, authors):
+    """Nest comment rows (in path order) into serialized trees, keyed by post id."""
+    by_id = {}
+    roots = {}
+    for row in rows:
+        node = comment_node(row, authors)
+        by_id[node['id']] = node
+        parent = by_id.get(node['parent'])
+        if parent is None:
+            roots.setdefault(node['post'], []).append(node)
+        else:
+            parent['replies'].append(node)
+    return roots
+
+
+def post_rows(queryset):
+    """``queryset`` as ``POST_FIELDS`` dicts (the keyset paginator reads them by name)."""
+    return queryset.values(*POST_FIELDS, *RANKING_FIELDS)
+
+
+def render_posts(posts, comments):
+    """Serialize ``posts`` (``post_rows`` dicts) with ``comments`` rows."""
+    authors = load_authors(referenced_authors(posts, comments))
+    return shape_posts(posts, comments, authors)
+
+
+async def arender_posts(posts, comments):
+    authors = await aload_authors(referenced_authors(posts, comments))
+    return shape_posts(posts, comments, authors)
+
+
+def referenced_authors(posts, comments):
+    return {post['author_id'] for post in posts} | {row[1] for row in comments}
+
+
+def shape_posts(posts, comments, authors):
+    threads = build_comments(comments, authors)
+    return [
+        {
+            'id': post['id'],
+            'title': post['title'],
+            'content': post['content'],
+            'author': authors[post['author_id']],
+            'created_at': format_datetime(post['created_at']),
+            'likes_count': post['likes_count'],
+            'comments_count': post['comments_count'],
+            'liked_by_me': False,
+            'comments': threads.get(post['id'], []),
+        }
+        for post in posts
+    ]
+
+
+def render_post_list(posts, preview_size):
+    post_ids = [post['id'] for post in posts]
+    return render_posts(posts, preview_comment_rows(post_ids, preview_size) if post_ids else [])
+
+
+async def arender_post_list(posts, preview_size):
+    post_ids = [post['id'] for post in posts]
+    comments = sorted(await acomment_rows(preview_comments(post_ids, preview_size))) if post_ids else []
+    return await arender_posts(posts, comments)
+
+
+def render_post_detail(pk):
+    """Serialized post ``pk`` with its whole thread, or ``None`` if it does not exist."""
+    posts = list(post_rows(Post.objects.filter(pk=pk)))
+    if not posts:
+        return None
+    comments = comment_rows(Comment.objects.filter(post_id=pk).order_by('path'))
+    return render_posts(posts, comments)[0]
+
+
+async def arender_post_detail(pk):
+    posts = [post async for post in post_rows(Post.objects.filter(pk=pk))]
+    if not posts:
+        return None
+    comments = await acomment_rows(Comment.objects.filter(post_id=pk).order_by('path'))
+    return (await arender_posts(posts, comments))[0]
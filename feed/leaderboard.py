@@ -0,0 +1,63 @@
+"""Sliding 24h karma leaderboard.
+
+Karma writes add to ``WindowKarma`` (see ``KarmaTransaction.save``). As the
+clock moves, ``slide()`` subtracts the hour buckets that dropped out of the
+window, so reading the top users never aggregates the ledger.
+"""
+from django.db import transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from .conditional import scope_validators
+from .models import KarmaBucket, LeaderboardWindow, WindowKarma
+
+TOP_N = 5
+
+
+def slide(now=None):
+    """Expire the hour buckets that fell out of the window ending at ``now``."""
+    new_start = KarmaBucket.window_start(now)
+    window = LeaderboardWindow.current()
+    if window.window_start >= new_start:
+        return
+
+    with transaction.atomic():
+        # Claim the slide; a concurrent caller that already moved the window
+        # makes this update match nothing and we leave the totals alone.
+        claimed = LeaderboardWindow.objects.filter(
+            pk=window.pk, window_start=window.window_start
+        ).update(window_start=new_start)
+        if not claimed:
+            return
+
+        expired = (
+            KarmaBucket.objects.filter(hour__gte=window.window_start, hour__lt=new_start)
+            .order_by()
+            .values('user_id')
+            .annotate(karma=Sum('karma'))
+        )
+        for row in expired.iterator():
+            WindowKarma.objects.filter(user_id=row['user_id']).update(karma=F('karma') - row['karma'])
+        WindowKarma.objects.filter(karma=0).delete()
+
+
+def top_user_ids(limit=TOP_N, now=None):
+    """Ids of the users with the most karma in the current window, best first."""
+    slide(now)
+    return list(
+        WindowKarma.objects.filter(karma__gt=0)
+        .order_by('-karma', 'user_id')
+        .values_list('user_id', flat=True)[:limit]
+    )
+
+
+def validators():
+    """ETag and Last-Modified of the leaderboard response."""
+    # The ranking changes with every karma write and whenever the window
+    # slides past an hour boundary.
+    now = timezone.now()
+    return scope_validators(
+        'leaderboard',
+        extra=[int(KarmaBucket.window_start(now).timestamp())],
+        not_before=KarmaBucket.truncate(now).timestamp()
+    )
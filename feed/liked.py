@@ -0,0 +1,142 @@
+"""``liked_by_me`` flags for the viewer of a response.
+
+Serialized posts and comments carry ``liked_by_me: false``, so the payloads
+stay the same for every viewer and can be shared through the response
+cache. ``flag()`` then fills the flags in for the logged-in viewer: it
+gathers the ids of every post and comment in the payload, nested comments
+and replies included, and asks which of them the viewer has liked in one
+query. Anonymous viewers have liked nothing and cost no query.
+
+With ``FEED_LIKED_CACHE`` on, the viewer's whole set of liked ids is cached
+instead, under the version of the ``liked:<user_id>`` scope, which every
+like and unlike of theirs bumps. Reads then cost no query until the next
+like, at the price of holding each active user's likes in the cache.
+"""
+from django.conf import settings
+from django.db.models import Q
+
+from . import cache
+from .models import Like
+
+NESTED = {'post': 'comments', 'comment': 'replies'}
+
+
+def viewer_id(user):
+    """The id whose likes are flagged for ``user``, or ``None`` for an anonymous one."""
+    if user is not None and user.is_authenticated:
+        return user.pk
+    return None
+
+
+def cache_enabled():
+    return getattr(settings, 'FEED_LIKED_CACHE', False) and cache.enabled()
+
+
+def _cache_key(user_id):
+    return f'feed:liked:{user_id}'
+
+
+def _timeout():
+    return getattr(settings, 'FEED_LIKED_CACHE_TIMEOUT', 300)
+
+
+def likes_of(user_id, post_ids=None, comment_ids=None):
+    """``(post_id, comment_id)`` rows of ``user_id``'s likes, limited to the given ids if any."""
+    queryset = Like.objects.filter(user_id=user_id)
+    if post_ids is not None or comment_ids is not None:
+        targets = Q()
+        if post_ids:
+            targets |= Q(post_id__in=post_ids)
+        if comment_ids:
+            targets |= Q(comment_id__in=comment_ids)
+        queryset = queryset.filter(targets)
+    return queryset.values_list('post_id', 'comment_id')
+
+
+def split(rows):
+    liked = {'post': set(), 'comment': set()}
+    for post_id, comment_id in rows:
+        if post_id is not None:
+            liked['post'].add(post_id)
+        else:
+            liked['comment'].add(comment_id)
+    return liked
+
+
+def lookup(user_id, post_ids=(), comment_ids=()):
+    """``{'post': ids, 'comment': ids}`` of the given ids that ``user_id`` has liked."""
+    if user_id is None or not (post_ids or comment_ids):
+        return {'post': set(), 'comment': set()}
+    if not cache_enabled():
+        return split(likes_of(user_id, post_ids, comment_ids))
+    backend = cache.get_cache()
+    version = cache.get_version(cache.liked_scope(user_id))
+    entry = backend.get(_cache_key(user_id))
+    if entry is None or entry[0] != version:
+        entry = (version, split(likes_of(user_id)))
+        backend.set(_cache_key(user_id), entry, _timeout())
+    return entry[1]
+
+
+async def alookup(user_id, post_ids=(), comment_ids=()):
+    if user_id is None or not (post_ids or comment_ids):
+        return {'post': set(), 'comment': set()}
+    if not cache_enabled():
+        return split([row async for row in likes_of(user_id, post_ids, comment_ids)])
+    backend = cache.get_cache()
+    version = cache.get_version(cache.liked_scope(user_id))
+    entry = await backend.aget(_cache_key(user_id))
+    if entry is None or entry[0] != version:
+        entry = (version, split([row async for row in likes_of(user_id)]))
+        await backend.aset(_cache_key(user_id), entry, _timeout())
+    return entry[1]
+
+
+def collect(items, kind, ids=None):
+    """``{'post': ids, 'comment': ids}`` of ``items`` and everything nested in them.
+
+    ``items`` are serialized posts or comments (``kind``), or search hits,
+    which name their own ``type``.
+    """
+    if ids is None:
+        ids = {'post': set(), 'comment': set()}
+    for item in items:
+        item_kind = item.get('type', kind)
+        ids[item_kind].add(item['id'])
+        collect(item.get(NESTED[item_kind], ()), 'comment', ids)
+    return ids
+
+
+def mark(items, kind, liked):
+    """Copies of ``items`` with ``liked_by_me`` set from ``liked``, at every level."""
+    marked = []
+    for item in items:
+        item_kind = item.get('type', kind)
+        item = {**item, 'liked_by_me': item['id'] in liked[item_kind]}
+        nested = NESTED[item_kind]
+        if nested in item:
+            item[nested] = mark(item[nested], 'comment', liked)
+        marked.append(item)
+    return marked
+
+
+def flag(user_id, items, kind):
+    """``items`` with ``liked_by_me`` filled in for ``user_id``, in at most one query."""
+    if user_id is None:
+        return items
+    ids = collect(items, kind)
+    return mark(items, kind, lookup(user_id, ids['post'], ids['comment']))
+
+
+async def aflag(user_id, items, kind):
+    if user_id is None:
+        return items
+    ids = collect(items, kind)
+    return mark(items, kind, await alookup(user_id, ids['post'], ids['comment']))
+
+
+def flag_page(user_id, data, kind):
+    """``flag()`` the ``results`` of a paginated payload."""
+    if user_id is None:
+        return data
+    return {**data, 'results': flag(user_id, data['results'], kind)}
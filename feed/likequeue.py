@@ -0,0 +1,90 @@
+"""Write-behind pipeline for likes on hot posts.
+
+With ``FEED_LIKE_WRITE_BEHIND`` on, like/unlike requests only append a
+``LikeEvent`` row and return. ``flush()`` (run by the ``flush_like_events``
+command) takes events in arrival order, collapses repeats per user and
+target, and applies them through ``feed.likes.apply_actions`` in one
+transaction per batch, so a burst of likes on one post costs a handful of
+statements instead of a locked write per request.
+
+If the flusher falls behind by more than ``FEED_LIKE_MAX_LAG`` seconds,
+requests go back to the synchronous path until it catches up, except for a
+user and target that still have events queued: those keep being queued, so
+they are applied after the earlier ones rather than before them.
+"""
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from . import cache
+from .likes import apply_actions
+from .models import LikeEvent
+
+STATS_KEY = 'feed:likequeue:stats'
+
+
+def write_behind(user_id, kind, target_id):
+    """Whether ``user_id``'s like request for ``kind`` ``target_id`` should be queued rather than applied inline."""
+    if not getattr(settings, 'FEED_LIKE_WRITE_BEHIND', False):
+        return False
+    max_lag = getattr(settings, 'FEED_LIKE_MAX_LAG', None)
+    return max_lag is None or pending_age() <= max_lag or has_pending(user_id, kind, target_id)
+
+
+def has_pending(user_id, kind, target_id):
+    return LikeEvent.objects.filter(user_id=user_id, **{f'{kind}_id': target_id}).exists()
+
+
+def enqueue(user, action, post=None, comment=None):
+    return LikeEvent.objects.create(user=user, action=action, post=post, comment=comment)
+
+
+def pending_age():
+    """Seconds the oldest queued event has been waiting, or 0."""
+    oldest = LikeEvent.objects.order_by('id').values_list('created_at', flat=True).first()
+    if oldest is None:
+        return 0
+    return (timezone.now() - oldest).total_seconds()
+
+
+def flush(batch_size=1000):
+    """Apply up to ``batch_size`` queued events; returns how many were applied."""
+    started = time.monotonic()
+    with transaction.atomic():
+        # Locking the batch keeps two flushers from applying the same
+        # events, or the same user's events out of order.
+        events = list(LikeEvent.objects.select_for_update().order_by('id')[:batch_size])
+        if not events:
+            return 0
+        apply_actions([
+            (event.user_id, {'action': event.action, 'post': event.post_id, 'comment': event.comment_id})
+            for event in events
+        ])
+        LikeEvent.objects.filter(id__in=[event.id for event in events]).delete()
+
+    stats = get_stats()
+    stats.update(
+        last_flush_at=time.time(),
+        last_flush_events=len(events),
+        last_flush_seconds=time.monotonic() - started,
+        last_flush_lag=(timezone.now() - events[0].created_at).total_seconds(),
+        flushed_total=stats.get('flushed_total', 0) + len(events),
+    )
+    cache.get_cache().set(STATS_KEY, stats, None)
+    return len(events)
+
+
+def get_stats():
+    return dict(cache.get_cache().get(STATS_KEY) or {})
+
+
+def metrics():
+    """Queue depth and flush lag, for monitoring."""
+    return {
+        'write_behind': getattr(settings, 'FEED_LIKE_WRITE_BEHIND', False),
+        'pending': LikeEvent.objects.count(),
+        'oldest_pending_seconds': pending_age(),
+        **get_stats(),
+    }
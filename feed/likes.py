@@ -0,0 +1,248 @@
+"""Like/unlike writes, singly or in batches.
+
+Likes are written with one conditional statement per target type:
+``INSERT ... ON CONFLICT DO NOTHING RETURNING`` to like and
+``DELETE ... RETURNING`` to unlike, so the database reports which rows
+actually changed. Karma and counters are only written for those, and a
+concurrent request for the same like finds the row already there (or
+already gone) instead of counting it twice.
+
+``RETURNING`` needs SQLite 3.35+ or PostgreSQL. On an older SQLite each
+like is inserted, and each unlike deleted, with its own statement instead,
+and the row count says whether it changed.
+
+Unliking writes a negative ``KarmaTransaction`` stamped with the like's own
+time, so it comes off the same hour bucket the like's karma went into.
+
+A batch costs one query per target type to look up authors, the two
+statements above, one counter UPDATE per table, one read of the leaderboard
+window and one upsert per karma rollup (see ``increment_many``), all in a
+single transaction, however many items it has.
+"""
+from datetime import timezone as dt_timezone
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.utils import timezone
+
+from . import cache, events, ranking
+from .models import Post, Comment, Like, KarmaTransaction
+
+POST_LIKE_KARMA = 5
+COMMENT_LIKE_KARMA = 1
+
+KARMA = {'post': POST_LIKE_KARMA, 'comment': COMMENT_LIKE_KARMA}
+COLUMNS = {'post': 'post_id', 'comment': 'comment_id'}
+
+
+def target_of(item):
+    """The ``(kind, id)`` a batch item refers to."""
+    if item.get('post') is not None:
+        return 'post', item['post']
+    return 'comment', item['comment']
+
+
+def apply_batch(user, items):
+    """Apply ``items`` (dicts with ``action`` and one of ``post``/``comment``) for ``user``.
+
+    Several items for the same target collapse to the last one, as if they
+    had been applied in order; the earlier ones are reported ``superseded``.
+    Returns one result dict per item, in order, with a ``status`` of
+    ``liked``, ``unliked``, ``already_liked``, ``not_liked``, ``not_found``
+    or ``superseded``.
+    """
+    statuses = apply_actions([(user.id, item) for item in items])
+    return [dict(item, status=status) for item, status in zip(items, statuses)]
+
+
+def toggle(user, action, kind, target_id):
+    """Like or unlike one post or comment; returns the status as ``apply_batch`` does."""
+    return apply_actions([(user.id, {'action': action, kind: target_id})])[0]
+
+
+def _connection():
+    return connections[router.db_for_write(Like)]
+
+
+def _can_return(connection):
+    return connection.features.can_return_columns_from_insert
+
+
+def _chunks(rows, params_per_row, connection):
+    limit = connection.features.max_query_params
+    size = max(limit // params_per_row, 1) if limit else len(rows)
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+
+def insert_likes(kind, pairs, created_at):
+    """Insert ``(user_id, target_id)`` likes of ``kind``, skipping those that exist.
+
+    Returns the pairs that were actually inserted.
+    """
+    connection = _connection()
+    quote = connection.ops.quote_name
+    stamp = Like._meta.get_field('created_at').get_db_prep_value(created_at, connection)
+    inserted = set()
+    if not _can_return(connection):
+        sql = (
+            f'INSERT INTO {quote(Like._meta.db_table)} (user_id, {COLUMNS[kind]}, created_at) '
+            'VALUES (%s, %s, %s) ON CONFLICT DO NOTHING'
+        )
+        with connection.cursor() as cursor:
+            for pair in pairs:
+                cursor.execute(sql, [*pair, stamp])
+                if cursor.rowcount:
+                    inserted.add(tuple(pair))
+        return inserted
+    for chunk in _chunks(pairs, 3, connection):
+        sql = (
+            f'INSERT INTO {quote(Like._meta.db_table)} (user_id, {COLUMNS[kind]}, created_at) '
+            f"VALUES {', '.join(['(%s, %s, %s)'] * len(chunk))} "
+            f'ON CONFLICT DO NOTHING RETURNING user_id, {COLUMNS[kind]}'
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [value for pair in chunk for value in (*pair, stamp)])
+            inserted.update(cursor.fetchall())
+    return inserted
+
+
+def delete_likes(kind, pairs):
+    """Delete the ``(user_id, target_id)`` likes of ``kind`` that exist.
+
+    Returns ``{pair: created_at}`` for the likes that were actually deleted.
+    """
+    connection = _connection()
+    if not _can_return(connection):
+        deleted = {}
+        for user_id, target_id in pairs:
+            likes = Like.objects.filter(user_id=user_id, **{COLUMNS[kind]: target_id})
+            created_at = likes.values_list('created_at', flat=True).first()
+            # Only the request whose DELETE removed the row counts it.
+            if created_at is not None and likes.delete()[0]:
+                deleted[user_id, target_id] = created_at
+        return deleted
+    quote = connection.ops.quote_name
+    field = Like._meta.get_field('created_at')
+    deleted = {}
+    for chunk in _chunks(pairs, 2, connection):
+        sql = (
+            f'DELETE FROM {quote(Like._meta.db_table)} '
+            f"WHERE (user_id, {COLUMNS[kind]}) IN (VALUES {', '.join(['(%s, %s)'] * len(chunk))}) "
+            f'RETURNING user_id, {COLUMNS[kind]}, created_at'
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [value for pair in chunk for value in pair])
+            for user_id, target_id, created_at in cursor.fetchall():
+                # SQLite hands raw cursors its stored UTC text, not a datetime.
+                created_at = field.to_python(created_at)
+                if settings.USE_TZ and timezone.is_naive(created_at):
+                    created_at = timezone.make_aware(created_at, dt_timezone.utc)
+                deleted[user_id, target_id] = created_at
+    return deleted
+
+
+def apply_actions(actions):
+    """Apply ``(user_id, item)`` pairs, possibly for many users; see ``apply_batch``.
+
+    Returns the status of each action, in order.
+    """
+    statuses = ['superseded'] * len(actions)
+    final = {(user_id, *target_of(item)): index for index, (user_id, item) in enumerate(actions)}
+    post_ids = {target_id for user_id, kind, target_id in final if kind == 'post'}
+    comment_ids = {target_id for user_id, kind, target_id in final if kind == 'comment'}
+    now = timezone.now()
+
+    with transaction.atomic():
+        authors = {}
+        if post_ids:
+            for post_id, author_id in Post.objects.filter(id__in=post_ids).values_list('id', 'author_id'):
+                authors['post', post_id] = author_id
+        comment_posts = {}
+        if comment_ids:
+            for comment_id, author_id, post_id in Comment.objects.filter(id__in=comment_ids).values_list(
+                'id', 'author_id', 'post_id'
+            ):
+                authors['comment', comment_id] = author_id
+                comment_posts[comment_id] = post_id
+
+        wanted = {kind: {'like': [], 'unlike': []} for kind in KARMA}
+        for key, index in final.items():
+            user_id, kind, target_id = key
+            if (kind, target_id) not in authors:
+                statuses[index] = 'not_found'
+            else:
+                wanted[kind][actions[index][1]['action']].append((user_id, target_id))
+
+        karma = []
+        likers = set()
+        deltas = {'post': {}, 'comment': {}}
+        for kind, pairs in wanted.items():
+            # Only rows the database reports as changed count: a like that
+            # already existed (or an unlike of one already gone) is a no-op.
+            liked = insert_likes(kind, pairs['like'], now) if pairs['like'] else set()
+            unliked = delete_likes(kind, pairs['unlike']) if pairs['unlike'] else {}
+            for user_id, target_id in pairs['like']:
+                changed = (user_id, target_id) in liked
+                statuses[final[user_id, kind, target_id]] = 'liked' if changed else 'already_liked'
+                if changed:
+                    karma.append(KarmaTransaction(
+                        user_id=authors[kind, target_id],
+                        karma=KARMA[kind],
+                        source_type=f'{kind}_like',
+                        source_id=target_id,
+                        created_at=now
+                    ))
+                    deltas[kind][target_id] = deltas[kind].get(target_id, 0) + 1
+                    likers.add(user_id)
+            for user_id, target_id in pairs['unlike']:
+                changed = (user_id, target_id) in unliked
+                statuses[final[user_id, kind, target_id]] = 'unliked' if changed else 'not_liked'
+                if changed:
+                    karma.append(KarmaTransaction(
+                        user_id=authors[kind, target_id],
+                        karma=-KARMA[kind],
+                        source_type=f'{kind}_like',
+                        source_id=target_id,
+                        created_at=unliked[user_id, target_id]
+                    ))
+                    deltas[kind][target_id] = deltas[kind].get(target_id, 0) - 1
+                    likers.add(user_id)
+
+        KarmaTransaction.record_many(karma)
+        if deltas['post']:
+            Post.objects.filter(pk__in=list(deltas['post'])).update(
+                **ranking.counter_update(likes=delta_case(deltas['post']))
+            )
+        apply_deltas(Comment, 'likes_count', deltas['comment'])
+
+        touched = set(deltas['post']) | {comment_posts[comment_id] for comment_id in deltas['comment']}
+        for post_id in touched:
+            cache.bump(*cache.post_scopes(post_id))
+        if likers:
+            cache.bump(*(cache.liked_scope(user_id) for user_id in likers))
+        for post_id, delta in deltas['post'].items():
+            if delta:
+                events.like_changed(post_id, None, delta)
+        for comment_id, delta in deltas['comment'].items():
+            if delta:
+                events.like_changed(comment_posts[comment_id], comment_id, delta)
+
+    return statuses
+
+
+def delta_case(deltas):
+    """An expression worth ``deltas[pk]`` on each row."""
+    return Case(
+        *[When(pk=pk, then=Value(delta)) for pk, delta in deltas.items()],
+        default=Value(0),
+        output_field=IntegerField()
+    )
+
+
+def apply_deltas(model, field, deltas):
+    """Add ``deltas[pk]`` to ``field`` of each row in one UPDATE."""
+    if not deltas:
+        return
+    model.objects.filter(pk__in=list(deltas)).update(**{field: F(field) + delta_case(deltas)})
@@ -0,0 +1,199 @@
+import json
+import math
+import random
+import time
+import urllib.request
+from contextlib import nullcontext
+from urllib.error import HTTPError
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.test.utils import override_settings, setup_test_environment
+
+from feed import synthetic
+from feed.models import Post
+from feed.querybudget import track_queries
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+SCENARIOS = ('feed', 'detail', 'thread', 'like', 'leaderboard')
+
+
+def percentile(samples, fraction):
+    """Nearest-rank percentile of ``samples`` (sorted)."""
+    return samples[max(0, math.ceil(fraction * len(samples)) - 1)]
+
+
+def rss_mb():
+    """Current resident set size in MB, or the peak where /proc is not available."""
+    if resource is None:
+        return None
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * resource.getpagesize() / 2 ** 20
+    except OSError:
+        # ru_maxrss is in kilobytes on Linux and bytes on macOS.
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class Command(BaseCommand):
+    help = 'Generate a synthetic dataset and measure latency, queries and memory of the main endpoints'
+
+    def add_arguments(self, parser):
+        data = parser.add_argument_group('dataset')
+        data.add_argument('--users', type=int, default=100)
+        data.add_argument('--posts', type=int, default=1000)
+        data.add_argument('--fanout', type=int, default=3, help='Replies per comment (and top-level comments per post)')
+        data.add_argument('--depth', type=int, default=3, help='Levels of comments per post')
+        data.add_argument('--likes-per-post', type=int, default=10)
+        data.add_argument('--karma-hours', type=int, default=72, help='Hours of karma history to spread likes over')
+        data.add_argument('--seed', type=int, default=None)
+        data.add_argument('--skip-generate', action='store_true', help='Benchmark the data already in the database')
+
+        run = parser.add_argument_group('run')
+        run.add_argument('--scenarios', nargs='*', choices=SCENARIOS, default=list(SCENARIOS))
+        run.add_argument('--requests', type=int, default=200, help='Requests per scenario')
+        run.add_argument('--warmup', type=int, default=10, help='Unmeasured requests per scenario')
+        run.add_argument(
+            '--base-url', default=None,
+            help='Drive a running server (e.g. http://127.0.0.1:8000) instead of the in-process test client; '
+                 'queries and RSS are then not measured'
+        )
+        run.add_argument(
+            '--no-cache', action='store_true', help='Disable the response cache so every read hits the database'
+        )
+        run.add_argument('--json', action='store_true', help='Print the results as JSON')
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1:
+            raise CommandError('--requests must be at least 1')
+        self.rng = random.Random(options['seed'])
+        report = {'dataset': None, 'scenarios': {}}
+
+        if not options['skip_generate']:
+            started = time.perf_counter()
+            report['dataset'] = synthetic.generate(
+                users=options['users'],
+                posts=options['posts'],
+                fanout=options['fanout'],
+                depth=options['depth'],
+                likes_per_post=options['likes_per_post'],
+                karma_hours=options['karma_hours'],
+                seed=options['seed'],
+            )
+            report['dataset']['seconds'] = round(time.perf_counter() - started, 2)
+            if not options['json']:
+                self.stdout.write(f"Generated {report['dataset']}")
+
+        self.post_ids = list(Post.objects.values_list('id', flat=True))
+        if not self.post_ids:
+            raise CommandError('No posts to benchmark; drop --skip-generate')
+        # The like endpoints act as the first user (see PostViewSet.like), so
+        # only posts it has not liked yet can be liked and unliked cleanly.
+        self.likeable_ids = list(
+            Post.objects.exclude(likes__user=User.objects.order_by('id').first()).values_list('id', flat=True)
+        )
+
+        if options['base_url']:
+            self.fetch = self.remote(options['base_url'].rstrip('/'))
+        else:
+            try:
+                # Lets the test client's 'testserver' host past ALLOWED_HOSTS.
+                setup_test_environment()
+            except RuntimeError:
+                pass  # Already set up, e.g. when run from the test suite.
+            self.client = Client()
+            self.fetch = self.local
+
+        with override_settings(FEED_CACHE_ENABLED=False) if options['no_cache'] else nullcontext():
+            for name in options['scenarios']:
+                requests = getattr(self, f'requests_{name}')
+                for method, url in requests(options['warmup']):
+                    self.fetch(method, url)
+                report['scenarios'][name] = self.measure(requests(options['requests']))
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+        else:
+            self.print_report(report['scenarios'])
+
+    def measure(self, requests):
+        latencies = []
+        queries = []
+        errors = 0
+        for method, url in requests:
+            started = time.perf_counter()
+            status, count = self.fetch(method, url)
+            latencies.append((time.perf_counter() - started) * 1000)
+            errors += status >= 400
+            if count is not None:
+                queries.append(count)
+        latencies.sort()
+        return {
+            'requests': len(latencies),
+            'errors': errors,
+            'p50_ms': round(percentile(latencies, 0.50), 2),
+            'p95_ms': round(percentile(latencies, 0.95), 2),
+            'p99_ms': round(percentile(latencies, 0.99), 2),
+            'queries_per_request': round(sum(queries) / len(queries), 2) if queries else None,
+            'rss_mb': round(rss_mb(), 1) if queries and resource else None,
+        }
+
+    def local(self, method, url):
+        with track_queries() as stats:
+            response = getattr(self.client, method)(url)
+            if response.streaming:
+                b''.join(response.streaming_content)
+        return response.status_code, stats.count
+
+    def remote(self, base_url):
+        def fetch(method, url):
+            request = urllib.request.Request(base_url + url, method=method.upper())
+            try:
+                with urllib.request.urlopen(request) as response:
+                    response.read()
+                    return response.status, None
+            except HTTPError as error:
+                return error.code, None
+        return fetch
+
+    def random_post(self):
+        return self.rng.choice(self.post_ids)
+
+    def requests_feed(self, count):
+        return [('get', '/api/posts/')] * count
+
+    def requests_detail(self, count):
+        return [('get', f'/api/posts/{self.random_post()}/') for i in range(count)]
+
+    def requests_thread(self, count):
+        return [('get', f'/api/posts/{self.random_post()}/comments/') for i in range(count)]
+
+    def requests_like(self, count):
+        # Like then unlike the same post so every request changes something
+        # (an odd count is rounded up to finish the last pair).
+        if not self.likeable_ids:
+            raise CommandError('Every post is already liked by the acting user')
+        requests = []
+        for i in range(0, count, 2):
+            post_id = self.rng.choice(self.likeable_ids)
+            requests.append(('post', f'/api/posts/{post_id}/like/'))
+            requests.append(('post', f'/api/posts/{post_id}/unlike/'))
+        return requests
+
+    def requests_leaderboard(self, count):
+        return [('get', '/api/leaderboard/')] * count
+
+    def print_report(self, scenarios):
+        columns = {
+            'requests': 'requests', 'errors': 'errors', 'p50_ms': 'p50 ms', 'p95_ms': 'p95 ms', 'p99_ms': 'p99 ms',
+            'queries_per_request': 'queries', 'rss_mb': 'RSS MB',
+        }
+        self.stdout.write(f"{'scenario':<12}" + ''.join(f'{title:>10}' for title in columns.values()))
+        for name, result in scenarios.items():
+            cells = ''.join(f"{'-' if result[column] is None else result[column]:>10}" for column in columns)
+            self.stdout.write(f'{name:<12}{cells}')
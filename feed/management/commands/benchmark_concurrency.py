@@ -0,0 +1,201 @@
+import asyncio
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+from wsgiref.util import setup_testing_defaults
+
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand, CommandError
+from django.core.wsgi import get_wsgi_application
+
+from feed.models import Post
+
+# Each endpoint as (WSGI path, ASGI path); {post} is filled with a post id.
+ENDPOINTS = {
+    'feed': ('/api/posts/', '/api/async/posts/'),
+    'detail': ('/api/posts/{post}/', '/api/async/posts/{post}/'),
+    'thread': ('/api/posts/{post}/comments/stream/', '/api/async/posts/{post}/comments/'),
+    'leaderboard': ('/api/leaderboard/', '/api/async/leaderboard/'),
+}
+
+
+def percentile(samples, fraction):
+    return samples[max(0, math.ceil(fraction * len(samples)) - 1)]
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare how the sync (WSGI) and async (ASGI) read paths hold up as concurrent clients grow, '
+        'optionally with slow clients'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--endpoint', choices=ENDPOINTS, default='feed')
+        parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 10, 50, 200])
+        parser.add_argument('--requests', type=int, default=400, help='Requests per concurrency level and path')
+        parser.add_argument(
+            '--client-delay', type=float, default=0.05,
+            help='Seconds each client takes to receive its response (a slow client)'
+        )
+        parser.add_argument(
+            '--wsgi-threads', type=int, default=4,
+            help='Request threads for the in-process WSGI path (gunicorn --threads x --workers)'
+        )
+        parser.add_argument('--wsgi-url', help='Benchmark a running WSGI server, e.g. http://127.0.0.1:8000')
+        parser.add_argument('--asgi-url', help='Benchmark a running ASGI server, e.g. http://127.0.0.1:8001')
+
+    def handle(self, *args, **options):
+        post_id = Post.objects.order_by('-id').values_list('id', flat=True).first()
+        if post_id is None:
+            raise CommandError('No posts; run `manage.py benchmark --requests 1` first to generate some')
+        wsgi_path, asgi_path = (path.format(post=post_id) for path in ENDPOINTS[options['endpoint']])
+        delay = options['client_delay']
+
+        if options['wsgi_url']:
+            wsgi = HttpDriver(options['wsgi_url'], delay)
+        else:
+            wsgi = WsgiDriver(get_wsgi_application(), options['wsgi_threads'], delay)
+        asgi = HttpDriver(options['asgi_url'], delay) if options['asgi_url'] else AsgiDriver(get_asgi_application(), delay)
+
+        self.stdout.write(
+            f"{'path':<6}{'clients':>8}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}"
+        )
+        for concurrency in options['concurrency']:
+            for name, driver, path in (('wsgi', wsgi, wsgi_path), ('asgi', asgi, asgi_path)):
+                result = asyncio.run(self.run_level(driver, path, concurrency, options['requests']))
+                self.stdout.write(
+                    f"{name:<6}{concurrency:>8}{result['rps']:>10.1f}{result['p50']:>10.1f}"
+                    f"{result['p95']:>10.1f}{result['p99']:>10.1f}{result['errors']:>8}"
+                )
+        wsgi.close()
+
+    async def run_level(self, driver, path, concurrency, total):
+        latencies = []
+        errors = 0
+        remaining = total
+
+        async def client():
+            nonlocal remaining, errors
+            while remaining > 0:
+                remaining -= 1
+                started = time.perf_counter()
+                status = await driver.get(path)
+                latencies.append((time.perf_counter() - started) * 1000)
+                errors += status >= 400
+
+        started = time.perf_counter()
+        await asyncio.gather(*(client() for i in range(concurrency)))
+        elapsed = time.perf_counter() - started
+        latencies.sort()
+        return {
+            'rps': len(latencies) / elapsed,
+            'p50': percentile(latencies, 0.50),
+            'p95': percentile(latencies, 0.95),
+            'p99': percentile(latencies, 0.99),
+            'errors': errors,
+        }
+
+
+class WsgiDriver:
+    """Calls the WSGI app on a fixed pool of threads, like a threaded WSGI server.
+
+    A slow client holds its request thread while the response is sent.
+    """
+
+    def __init__(self, app, threads, delay):
+        self.app = app
+        self.delay = delay
+        self.pool = ThreadPoolExecutor(max_workers=threads)
+
+    def call(self, path):
+        environ = {'PATH_INFO': path, 'HTTP_HOST': 'localhost', 'SERVER_NAME': 'localhost'}
+        setup_testing_defaults(environ)
+        status = []
+        body = self.app(environ, lambda line, headers, exc_info=None: status.append(int(line.split()[0])))
+        try:
+            for chunk in body:
+                pass
+            time.sleep(self.delay)
+        finally:
+            if hasattr(body, 'close'):
+                body.close()
+        return status[0]
+
+    async def get(self, path):
+        return await asyncio.get_running_loop().run_in_executor(self.pool, self.call, path)
+
+    def close(self):
+        self.pool.shutdown()
+
+
+class AsgiDriver:
+    """Calls the ASGI app in the event loop; a slow client only delays its own task."""
+
+    def __init__(self, app, delay):
+        self.app = app
+        self.delay = delay
+
+    async def get(self, path):
+        scope = {
+            'type': 'http',
+            'asgi': {'version': '3.0'},
+            'http_version': '1.1',
+            'method': 'GET',
+            'scheme': 'http',
+            'path': path,
+            'raw_path': path.encode(),
+            'query_string': b'',
+            'root_path': '',
+            'headers': [(b'host', b'localhost')],
+            'server': ('localhost', 80),
+            'client': ('127.0.0.1', 50000),
+        }
+        received = False
+        disconnected = asyncio.Event()
+        status = []
+
+        async def receive():
+            nonlocal received
+            if not received:
+                received = True
+                return {'type': 'http.request', 'body': b'', 'more_body': False}
+            await disconnected.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                status.append(message['status'])
+            elif not message.get('more_body'):
+                await asyncio.sleep(self.delay)
+
+        await self.app(scope, receive, send)
+        disconnected.set()
+        return status[0]
+
+
+class HttpDriver:
+    """Plain HTTP/1.1 GETs against a running server, one connection per request."""
+
+    def __init__(self, base_url, delay):
+        parts = urlsplit(base_url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.delay = delay
+
+    async def get(self, path):
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        try:
+            writer.write(f'GET {path} HTTP/1.1\r\nHost: {self.host}\r\nConnection: close\r\n\r\n'.encode())
+            await writer.drain()
+            status_line = await reader.readline()
+            await asyncio.sleep(self.delay)
+            await reader.read()
+            return int(status_line.split()[1]) if status_line else 599
+        except OSError:
+            return 599
+        finally:
+            writer.close()
+
+    def close(self):
+        pass
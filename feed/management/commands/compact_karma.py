@@ -0,0 +1,45 @@
+import gzip
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from feed import compaction
+from feed.streaming import dumps
+
+
+class Command(BaseCommand):
+    help = 'Fold old karma transactions into per-user daily summaries, in chunks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, help='Compact rows older than this many days (default: FEED_KARMA_COMPACT_AFTER_DAYS)')
+        parser.add_argument('--chunk-size', type=int, default=compaction.CHUNK_SIZE)
+        parser.add_argument('--archive-dir', help='Write the compacted rows to karma-<timestamp>.ndjson.gz here first')
+        parser.add_argument('--dry-run', action='store_true', help='Only count the rows that would be compacted')
+
+    def handle(self, *args, **options):
+        try:
+            before = compaction.cutoff(options['days'])
+        except ValueError as exc:
+            raise CommandError(str(exc)) from exc
+        if options['dry_run']:
+            self.stdout.write(f'{compaction.pending(before).count()} karma transaction(s) before {before:%Y-%m-%d} to compact')
+            return
+
+        archive = None
+        if options['archive_dir']:
+            os.makedirs(options['archive_dir'], exist_ok=True)
+            filename = os.path.join(options['archive_dir'], f'karma-{timezone.now():%Y%m%dT%H%M%S}.ndjson.gz')
+            archive = gzip.open(filename, 'wb')
+        total = 0
+        try:
+            write = (lambda rows: archive.write(b''.join(dumps(row) + b'\n' for row in rows))) if archive else None
+            for rows in compaction.compact(before, options['chunk_size'], write):
+                total += rows
+                if options['verbosity'] > 1:
+                    self.stdout.write(f'{total} row(s)')
+        finally:
+            if archive is not None:
+                archive.close()
+                self.stdout.write(f'Archived to {filename}')
+        self.stdout.write(f'Compacted {total} karma transaction(s) before {before:%Y-%m-%d}')
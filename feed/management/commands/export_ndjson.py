@@ -0,0 +1,33 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from feed import export
+
+
+class Command(BaseCommand):
+    help = 'Export posts, comments, likes, karma transactions and daily karma summaries as newline-delimited JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('tables', nargs='*', help=f"Tables to export: {', '.join(export.MODELS)} (default: all)")
+        parser.add_argument('--output-dir', default='.', help='Directory to write <table>.ndjson files to')
+        parser.add_argument('--chunk-size', type=int, default=export.CHUNK_SIZE)
+        parser.add_argument('--gzip', action='store_true', help='Write <table>.ndjson.gz instead')
+
+    def handle(self, *args, **options):
+        tables = options['tables'] or list(export.MODELS)
+        unknown = set(tables) - set(export.MODELS)
+        if unknown:
+            raise CommandError(f"Unknown table(s): {', '.join(sorted(unknown))}")
+        os.makedirs(options['output_dir'], exist_ok=True)
+        for name in tables:
+            filename = os.path.join(options['output_dir'], f"{name}.ndjson{'.gz' if options['gzip'] else ''}")
+            pieces = export.iter_ndjson(name, options['chunk_size'])
+            if options['gzip']:
+                pieces = export.gzipped(pieces)
+            size = 0
+            with open(filename, 'wb') as output:
+                for piece in pieces:
+                    output.write(piece)
+                    size += len(piece)
+            self.stdout.write(f'Wrote {filename} ({size} bytes)')
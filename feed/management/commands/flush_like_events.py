@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from feed import likequeue
+
+
+class Command(BaseCommand):
+    help = 'Apply queued write-behind like/unlike events in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--loop', action='store_true', help='Keep flushing until interrupted')
+        parser.add_argument('--interval', type=float, default=1.0, help='Seconds to sleep when the queue is empty')
+
+    def handle(self, *args, **options):
+        while True:
+            flushed = likequeue.flush(options['batch_size'])
+            if flushed:
+                self.stdout.write(f"Applied {flushed} like event(s)")
+                continue
+            if not options['loop']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from feed import search
+
+
+class Command(BaseCommand):
+    help = 'Re-index every post and comment for full-text search, in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=search.BATCH_SIZE)
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        totals = {}
+        try:
+            for model, rows in search.rebuild(options['batch_size'], options['database']):
+                totals[model.__name__] = totals.get(model.__name__, 0) + rows
+                if options['verbosity'] > 1:
+                    self.stdout.write(f'{model.__name__}: {totals[model.__name__]} row(s)')
+        except NotImplementedError as exc:
+            raise CommandError(str(exc)) from exc
+        for name, rows in totals.items():
+            self.stdout.write(f'{name}: re-indexed {rows} row(s)')
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from feed import cache, ranking
+from feed.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Recompute every post\'s hot score from its like and comment counts, in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=ranking.BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        changed = ranking.recompute(Post.objects.all(), options['batch_size'])
+        if changed:
+            cache.bump('feed')
+        self.stdout.write(f'Post: {changed} hot score(s) updated')
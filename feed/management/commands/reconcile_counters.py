@@ -0,0 +1,76 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from feed import cache, ranking
+from feed.models import Post, Comment, Like
+
+
+def count_of(queryset, field):
+    """Correlated COUNT(*) subquery over ``queryset`` grouped by ``field``."""
+    counts = queryset.filter(**{field: OuterRef('pk')}).order_by().values(field).annotate(n=Count('pk')).values('n')
+    return Coalesce(Subquery(counts, output_field=IntegerField()), Value(0))
+
+
+class Command(BaseCommand):
+    help = 'Recompute the denormalized like and comment counters and fix any drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true', help='Report drift without writing')
+
+    def handle(self, *args, **options):
+        targets = [
+            (Post, {
+                'likes_count': count_of(Like.objects.all(), 'post'),
+                'comments_count': count_of(Comment.objects.all(), 'post'),
+            }),
+            (Comment, {
+                'likes_count': count_of(Like.objects.all(), 'comment'),
+                'replies_count': count_of(Comment.objects.all(), 'parent'),
+            }),
+        ]
+        for model, expected in targets:
+            fixed = self.reconcile(model, expected, options['batch_size'], options['dry_run'])
+            self.stdout.write(f"{model.__name__}: {fixed} row(s) drifted")
+            if model is Post and fixed and not options['dry_run']:
+                # Hot scores were moved along with the drifted counters.
+                ranking.recompute(Post.objects.all(), options['batch_size'])
+
+    def reconcile(self, model, expected, batch_size, dry_run):
+        fields = list(expected)
+        # The post whose cached pages show each row's counters.
+        post_field = 'pk' if model is Post else 'post_id'
+        annotations = {f'actual_{field}': value for field, value in expected.items()}
+        last_pk = 0
+        drifted = 0
+        while True:
+            with transaction.atomic():
+                # Lock the batch so live F() increments cannot interleave with
+                # the absolute values written back below.
+                batch = list(
+                    model.objects.select_for_update()
+                    .filter(pk__gt=last_pk)
+                    .order_by('pk')
+                    .only('pk', post_field, *fields)
+                    .annotate(**annotations)[:batch_size]
+                )
+                if not batch:
+                    return drifted
+                changed = []
+                for obj in batch:
+                    stale = False
+                    for field in fields:
+                        actual = getattr(obj, f'actual_{field}')
+                        if getattr(obj, field) != actual:
+                            setattr(obj, field, actual)
+                            stale = True
+                    if stale:
+                        changed.append(obj)
+                if changed and not dry_run:
+                    model.objects.bulk_update(changed, fields)
+                    post_ids = {getattr(obj, post_field) for obj in changed}
+                    cache.bump(*{scope for post_id in post_ids for scope in cache.post_scopes(post_id)})
+                drifted += len(changed)
+                last_pk = batch[-1].pk
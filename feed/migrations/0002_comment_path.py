@@ -0,0 +1,50 @@
+# Generated by Django 6.0.1 on 2026-10-17 06:01
+
+from django.db import migrations, models
+
+
+def backfill_comment_paths(apps, schema_editor):
+    db = schema_editor.connection.alias
+    Comment = apps.get_model('feed', 'Comment')
+
+    # Walk the forest one level at a time so every parent already has its
+    # path when its children are visited.
+    depth = 0
+    pending = Comment.objects.using(db).filter(parent__isnull=True, path='')
+    while True:
+        batch = []
+        for comment in pending.select_related('parent').only('id', 'parent__path').iterator(chunk_size=2000):
+            parent_path = comment.parent.path if comment.parent_id else ''
+            comment.path = f"{parent_path}{comment.id:010d}/"
+            comment.depth = depth
+            batch.append(comment)
+        if not batch:
+            break
+        Comment.objects.using(db).bulk_update(batch, ['path', 'depth'], batch_size=1000)
+        depth += 1
+        pending = Comment.objects.using(db).filter(parent__depth=depth - 1, path='').exclude(parent__path='')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feed', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='depth',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='path',
+            field=models.CharField(blank=True, default='', editable=False, max_length=1100),
+        ),
+        migrations.RunPython(backfill_comment_paths, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', 'path'], name='feed_commen_post_id_d5dd9a_idx'),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 6.0.1 on 2026-10-17 06:20
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_counters(apps, schema_editor):
+    db = schema_editor.connection.alias
+    Post = apps.get_model('feed', 'Post')
+    Comment = apps.get_model('feed', 'Comment')
+    Like = apps.get_model('feed', 'Like')
+
+    def count_of(queryset, field):
+        counts = queryset.filter(**{field: OuterRef('pk')}).order_by().values(field).annotate(n=Count('pk')).values('n')
+        return Coalesce(Subquery(counts, output_field=IntegerField()), Value(0))
+
+    Post.objects.using(db).update(
+        likes_count=count_of(Like.objects.using(db), 'post'),
+        comments_count=count_of(Comment.objects.using(db), 'post'),
+    )
+    Comment.objects.using(db).update(likes_count=count_of(Like.objects.using(db), 'comment'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feed', '0002_comment_path'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='likes_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='comments_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='likes_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
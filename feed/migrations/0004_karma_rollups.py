@@ -0,0 +1,63 @@
+# Generated by Django 6.0.1 on 2026-10-17 06:34
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Sum
+from django.db.models.functions import TruncHour
+
+
+def backfill_karma_rollups(apps, schema_editor):
+    db = schema_editor.connection.alias
+    KarmaTransaction = apps.get_model('feed', 'KarmaTransaction')
+    UserKarma = apps.get_model('feed', 'UserKarma')
+    KarmaBucket = apps.get_model('feed', 'KarmaBucket')
+
+    totals = KarmaTransaction.objects.using(db).order_by().values('user_id').annotate(total=Sum('karma'))
+    UserKarma.objects.using(db).bulk_create(
+        (UserKarma(user_id=row['user_id'], total=row['total']) for row in totals.iterator()),
+        batch_size=1000,
+    )
+    buckets = (
+        KarmaTransaction.objects.using(db).order_by()
+        .annotate(hour=TruncHour('created_at'))
+        .values('user_id', 'hour')
+        .annotate(karma=Sum('karma'))
+    )
+    KarmaBucket.objects.using(db).bulk_create(
+        (KarmaBucket(user_id=row['user_id'], hour=row['hour'], karma=row['karma']) for row in buckets.iterator()),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('feed', '0003_like_comment_counters'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserKarma',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='karma', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('total', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='KarmaBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hour', models.DateTimeField()),
+                ('karma', models.IntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='karma_buckets', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['hour'], name='feed_karmab_hour_079df1_idx')],
+                'unique_together': {('user', 'hour')},
+            },
+        ),
+        migrations.RunPython(backfill_karma_rollups, migrations.RunPython.noop),
+    ]
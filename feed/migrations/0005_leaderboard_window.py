@@ -0,0 +1,56 @@
+# Generated by Django 6.0.1 on 2026-10-17 06:52
+
+import django.db.models.deletion
+from django.conf import settings
+from datetime import timedelta
+from django.db import migrations, models
+from django.db.models import Sum
+from django.utils import timezone
+
+
+def seed_leaderboard_window(apps, schema_editor):
+    db = schema_editor.connection.alias
+    KarmaBucket = apps.get_model('feed', 'KarmaBucket')
+    LeaderboardWindow = apps.get_model('feed', 'LeaderboardWindow')
+    WindowKarma = apps.get_model('feed', 'WindowKarma')
+
+    window_start = timezone.now().replace(minute=0, second=0, microsecond=0) - timedelta(hours=23)
+    LeaderboardWindow.objects.using(db).create(pk=1, window_start=window_start)
+    totals = (
+        KarmaBucket.objects.using(db).filter(hour__gte=window_start)
+        .order_by()
+        .values('user_id')
+        .annotate(karma=Sum('karma'))
+    )
+    WindowKarma.objects.using(db).bulk_create(
+        WindowKarma(user_id=row['user_id'], karma=row['karma']) for row in totals.iterator()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('feed', '0004_karma_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LeaderboardWindow',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('window_start', models.DateTimeField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='WindowKarma',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='window_karma', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('karma', models.IntegerField(default=0)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['-karma', 'user'], name='feed_window_karma_bec1cc_idx')],
+            },
+        ),
+        migrations.RunPython(seed_leaderboard_window, migrations.RunPython.noop),
+    ]
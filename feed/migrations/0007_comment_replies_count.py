@@ -0,0 +1,32 @@
+# Generated by Django 6.0.1 on 2026-10-17 07:32
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_replies_count(apps, schema_editor):
+    db = schema_editor.connection.alias
+    Comment = apps.get_model('feed', 'Comment')
+    replies = Comment.objects.using(db).filter(parent=OuterRef('pk')).order_by().values('parent').annotate(n=Count('pk')).values('n')
+    Comment.objects.using(db).update(replies_count=Coalesce(Subquery(replies, output_field=IntegerField()), Value(0)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feed', '0006_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='replies_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_replies_count, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', 'parent', 'path'], name='feed_commen_post_id_a719c6_idx'),
+        ),
+    ]
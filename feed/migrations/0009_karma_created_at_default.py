@@ -0,0 +1,19 @@
+# Generated by Django 6.0.1 on 2026-10-17 09:10
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feed', '0008_like_event'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='karmatransaction',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
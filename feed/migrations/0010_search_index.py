@@ -0,0 +1,106 @@
+# Generated by Django 6.0.1 on 2026-10-17 10:05
+
+from django.db import migrations
+
+# SQLite: FTS5 tables holding their own copy of the text, keyed by the
+# post/comment id and kept in step by triggers.
+SQLITE_FORWARDS = [
+    "CREATE VIRTUAL TABLE feed_post_fts USING fts5(title, content, tokenize='porter unicode61')",
+    """CREATE TRIGGER feed_post_fts_insert AFTER INSERT ON feed_post BEGIN
+        INSERT INTO feed_post_fts(rowid, title, content) VALUES (new.id, new.title, new.content);
+    END""",
+    """CREATE TRIGGER feed_post_fts_delete AFTER DELETE ON feed_post BEGIN
+        DELETE FROM feed_post_fts WHERE rowid = old.id;
+    END""",
+    """CREATE TRIGGER feed_post_fts_update AFTER UPDATE OF title, content ON feed_post BEGIN
+        DELETE FROM feed_post_fts WHERE rowid = old.id;
+        INSERT INTO feed_post_fts(rowid, title, content) VALUES (new.id, new.title, new.content);
+    END""",
+    'INSERT INTO feed_post_fts(rowid, title, content) SELECT id, title, content FROM feed_post',
+    "CREATE VIRTUAL TABLE feed_comment_fts USING fts5(content, tokenize='porter unicode61')",
+    """CREATE TRIGGER feed_comment_fts_insert AFTER INSERT ON feed_comment BEGIN
+        INSERT INTO feed_comment_fts(rowid, content) VALUES (new.id, new.content);
+    END""",
+    """CREATE TRIGGER feed_comment_fts_delete AFTER DELETE ON feed_comment BEGIN
+        DELETE FROM feed_comment_fts WHERE rowid = old.id;
+    END""",
+    """CREATE TRIGGER feed_comment_fts_update AFTER UPDATE OF content ON feed_comment BEGIN
+        DELETE FROM feed_comment_fts WHERE rowid = old.id;
+        INSERT INTO feed_comment_fts(rowid, content) VALUES (new.id, new.content);
+    END""",
+    'INSERT INTO feed_comment_fts(rowid, content) SELECT id, content FROM feed_comment',
+]
+
+SQLITE_BACKWARDS = [
+    'DROP TRIGGER feed_post_fts_insert',
+    'DROP TRIGGER feed_post_fts_delete',
+    'DROP TRIGGER feed_post_fts_update',
+    'DROP TABLE feed_post_fts',
+    'DROP TRIGGER feed_comment_fts_insert',
+    'DROP TRIGGER feed_comment_fts_delete',
+    'DROP TRIGGER feed_comment_fts_update',
+    'DROP TABLE feed_comment_fts',
+]
+
+# PostgreSQL: a search_vector column per table, set by a BEFORE trigger and
+# indexed with GIN. Titles weigh more than content.
+POSTGRES_FORWARDS = [
+    'ALTER TABLE feed_post ADD COLUMN search_vector tsvector',
+    """CREATE FUNCTION feed_post_search_vector() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector := setweight(to_tsvector('english', coalesce(NEW.title, '')), 'A')
+            || setweight(to_tsvector('english', coalesce(NEW.content, '')), 'B');
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql""",
+    """CREATE TRIGGER feed_post_search_vector BEFORE INSERT OR UPDATE OF title, content ON feed_post
+    FOR EACH ROW EXECUTE FUNCTION feed_post_search_vector()""",
+    'UPDATE feed_post SET title = title',
+    'CREATE INDEX feed_post_search_vector_idx ON feed_post USING GIN (search_vector)',
+    'ALTER TABLE feed_comment ADD COLUMN search_vector tsvector',
+    """CREATE FUNCTION feed_comment_search_vector() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector := setweight(to_tsvector('english', coalesce(NEW.content, '')), 'B');
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql""",
+    """CREATE TRIGGER feed_comment_search_vector BEFORE INSERT OR UPDATE OF content ON feed_comment
+    FOR EACH ROW EXECUTE FUNCTION feed_comment_search_vector()""",
+    'UPDATE feed_comment SET content = content',
+    'CREATE INDEX feed_comment_search_vector_idx ON feed_comment USING GIN (search_vector)',
+]
+
+POSTGRES_BACKWARDS = [
+    'DROP TRIGGER feed_post_search_vector ON feed_post',
+    'DROP FUNCTION feed_post_search_vector()',
+    'ALTER TABLE feed_post DROP COLUMN search_vector',
+    'DROP TRIGGER feed_comment_search_vector ON feed_comment',
+    'DROP FUNCTION feed_comment_search_vector()',
+    'ALTER TABLE feed_comment DROP COLUMN search_vector',
+]
+
+STATEMENTS = {
+    'sqlite': (SQLITE_FORWARDS, SQLITE_BACKWARDS),
+    'postgresql': (POSTGRES_FORWARDS, POSTGRES_BACKWARDS),
+}
+
+
+def create_search_index(apps, schema_editor):
+    for statement in STATEMENTS.get(schema_editor.connection.vendor, ([], []))[0]:
+        schema_editor.execute(statement)
+
+
+def drop_search_index(apps, schema_editor):
+    for statement in STATEMENTS.get(schema_editor.connection.vendor, ([], []))[1]:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feed', '0009_karma_created_at_default'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 6.0.1 on 2026-10-17 10:40
+
+import importlib
+import math
+from datetime import datetime, timezone
+
+from django.db import migrations, models
+
+# feed.ranking at the time of writing.
+COMMENT_WEIGHT = 2
+DECAY_SECONDS = 45000
+EPOCH = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+
+def restore_search_triggers(apps, schema_editor):
+    """Adding a column with a default rebuilds feed_post on SQLite, which
+    drops the full-text search triggers on it (removing one may not)."""
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    search_index = importlib.import_module('feed.migrations.0010_search_index')
+    for statement in search_index.SQLITE_FORWARDS:
+        if statement.startswith('CREATE TRIGGER feed_post_'):
+            schema_editor.execute(statement.replace('CREATE TRIGGER', 'CREATE TRIGGER IF NOT EXISTS', 1))
+
+
+def compute_hot_scores(apps, schema_editor):
+    db = schema_editor.connection.alias
+    Post = apps.get_model('feed', 'Post')
+    last_pk = 0
+    while True:
+        batch = list(Post.objects.using(db).filter(pk__gt=last_pk).order_by('pk')[:1000])
+        if not batch:
+            return
+        for post in batch:
+            engagement = max(post.likes_count + COMMENT_WEIGHT * post.comments_count, 1)
+            post.hot_score = math.log10(engagement) + (post.created_at - EPOCH).total_seconds() / DECAY_SECONDS
+        Post.objects.using(db).bulk_update(batch, ['hot_score'])
+        last_pk = batch[-1].pk
+
+
+def forwards(apps, schema_editor):
+    restore_search_triggers(apps, schema_editor)
+    compute_hot_scores(apps, schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feed', '0010_search_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(migrations.RunPython.noop, restore_search_triggers),
+        migrations.AddField(
+            model_name='post',
+            name='hot_score',
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.RunPython(forwards, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['-hot_score', '-id'], name='feed_post_hot_sco_a99c4c_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['-likes_count', '-id'], name='feed_post_likes_c_48f1fe_idx'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 6.0.1 on 2026-10-17 12:10
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feed', '0013_like_exactly_one_target'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['parent', 'created_at'], name='feed_commen_parent__273c50_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='like',
+            constraint=models.UniqueConstraint(condition=models.Q(('post__isnull', False)), fields=('user', 'post'), name='like_unique_post'),
+        ),
+        migrations.AddConstraint(
+            model_name='like',
+            constraint=models.UniqueConstraint(condition=models.Q(('comment__isnull', False)), fields=('user', 'comment'), name='like_unique_comment'),
+        ),
+        # Dropped only once the partial constraints are in place.
+        migrations.AlterUniqueTogether(
+            name='like',
+            unique_together=set(),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 6.0.1 on 2026-10-17 12:30
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feed', '0014_query_plan_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['created_at', 'likes_count', 'id'], name='feed_post_created_4cdd13_idx'),
+        ),
+    ]
@@ -1,38 +1,146 @@
-from django.db import models
+from datetime import timedelta
+from django.db import connections, models, router, transaction, IntegrityError
+from django.db.models import F, Q
+from django.utils import timezone
+from . import cache, events, ranking
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
 
+
+def without_counters(instance, kwargs):
+    """``save()`` kwargs that leave ``instance.COUNTER_FIELDS`` alone on an update.
+
+    The counters are only ever changed by ``F()`` updates, and an instance
+    loaded before one of those would otherwise write its stale copy back.
+    """
+    if instance._state.adding or kwargs.get('force_insert') or kwargs.get('update_fields') is not None:
+        return kwargs
+    fields = [
+        field.name for field in instance._meta.concrete_fields
+        if not field.primary_key and field.name not in instance.COUNTER_FIELDS
+    ]
+    return {**kwargs, 'update_fields': fields}
+
 class Post(models.Model):
     title = models.CharField(max_length=200, default='Untitled Post')
     content = models.TextField()
     author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='posts')
+    likes_count = models.PositiveIntegerField(default=0, editable=False)
+    comments_count = models.PositiveIntegerField(default=0, editable=False)
+    # See feed.ranking; kept current by counter_update() alongside the counters.
+    hot_score = models.FloatField(default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    # Written by counter_update() and reconcile_counters, never by save().
+    COUNTER_FIELDS = ('likes_count', 'comments_count', 'hot_score')
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['-created_at', '-id']),
+            models.Index(fields=['-hot_score', '-id']),
+            models.Index(fields=['-likes_count', '-id']),
+            # Covers the windowed ?sort=top read (see feed.ranking.window_keys).
+            models.Index(fields=['created_at', 'likes_count', 'id']),
+        ]
+    
     def __str__(self):
         return self.title
+    
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            super().save(*args, **without_counters(self, kwargs))
+        else:
+            # Scored in the same transaction, so no reader ranks it by the default 0.
+            with transaction.atomic():
+                super().save(*args, **kwargs)
+                # The score's age term needs created_at, which is set on insert.
+                self.hot_score = ranking.hot_score(self.likes_count, self.comments_count, self.created_at)
+                Post.objects.filter(pk=self.pk).update(hot_score=self.hot_score)
+        cache.bump(*cache.post_scopes(self.pk))
+    
+    def delete(self, *args, **kwargs):
+        scopes = cache.post_scopes(self.pk)
+        result = super().delete(*args, **kwargs)
+        cache.bump(*scopes)
+        return result
+
+# Comment.path is the materialized path of a comment: the zero-padded ids of
+# its ancestors and itself, e.g. "0000000003/0000000012/". Sorting a post's
+# comments by path yields the thread in depth-first order, and a subtree is a
+# prefix range scan on (post, path).
+def comment_path_segment(comment_id):
+    return f"{comment_id:010d}/"
+
+
+def subtree_range(path):
+    """The comments at or below ``path``, as a range the ``(post, path)`` index can seek.
+
+    ``'/'`` sorts just before ``'0'``, so every path under ``.../0000000042/``
+    is below ``.../00000000420``. A ``LIKE`` prefix match cannot use the index.
+    """
+    return Q(path__gte=path, path__lt=path[:-1] + '0')
+
 
 class Comment(models.Model):
     post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='comments')
     parent = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True, related_name='replies')
     author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='comments')
     content = models.TextField()
+    path = models.CharField(max_length=1100, blank=True, default='', editable=False)
+    depth = models.PositiveIntegerField(default=0, editable=False)
+    likes_count = models.PositiveIntegerField(default=0, editable=False)
+    replies_count = models.PositiveIntegerField(default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    COUNTER_FIELDS = ('likes_count', 'replies_count')
+    
     class Meta:
         ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['post', 'path']),
+            models.Index(fields=['post', 'parent', 'path']),
+            # Replies in creation order, for the ``replies`` prefetch.
+            models.Index(fields=['parent', 'created_at']),
+            models.Index(fields=['created_at', 'id']),
+        ]
     
     def __str__(self):
         return f"Comment by {self.author.username} on {self.post.title}"
     
     def clean(self):
-        if self.parent and self.parent.post != self.post:
+        if self.parent and self.parent.post_id != self.post_id:
             raise ValidationError("Parent comment must belong to the same post")
     
     def save(self, *args, **kwargs):
         self.clean()
-        super().save(*args, **kwargs)
+        if not self._state.adding:
+            super().save(*args, **without_counters(self, kwargs))
+        else:
+            # One transaction, so no reader sees the row before its path is
+            # set (an empty path sorts first) or the counters without it.
+            with transaction.atomic():
+                self.depth = self.parent.depth + 1 if self.parent else 0
+                super().save(*args, **kwargs)
+                # The path ends with our own id, which only exists after the insert.
+                parent_path = self.parent.path if self.parent else ''
+                self.path = parent_path + comment_path_segment(self.pk)
+                Comment.objects.filter(pk=self.pk).update(path=self.path)
+                Post.objects.filter(pk=self.post_id).update(**ranking.counter_update(comments=1))
+                if self.parent_id:
+                    Comment.objects.filter(pk=self.parent_id).update(replies_count=F('replies_count') + 1)
+                events.comment_created(self)
+        cache.bump(*cache.post_scopes(self.post_id))
+    
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        cache.bump(*cache.post_scopes(self.post_id))
+        return result
+    
+    def subtree(self):
+        """This comment and all of its descendants, in thread order."""
+        return Comment.objects.filter(subtree_range(self.path), post_id=self.post_id).order_by('path')
 
 class Like(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='likes')
@@ -41,7 +149,18 @@ class Like(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
-        unique_together = [['user', 'post'], ['user', 'comment']]
+        constraints = [
+            # Partial, so neither index holds the rows whose target is NULL.
+            models.UniqueConstraint(fields=['user', 'post'], condition=Q(post__isnull=False), name='like_unique_post'),
+            models.UniqueConstraint(
+                fields=['user', 'comment'], condition=Q(comment__isnull=False), name='like_unique_comment'
+            ),
+            # feed.likes inserts with raw SQL, which clean() never sees.
+            models.CheckConstraint(
+                condition=Q(post__isnull=False, comment__isnull=True) | Q(post__isnull=True, comment__isnull=False),
+                name='like_exactly_one_target'
+            ),
+        ]
     
     def __str__(self):
         if self.post:
@@ -49,14 +168,30 @@ class Like(models.Model):
         return f"{self.user.username} liked comment by {self.comment.author.username}"
     
     def clean(self):
-        if not self.post and not self.comment:
+        if self.post_id is None and self.comment_id is None:
             raise ValidationError("Like must be associated with either a post or a comment")
-        if self.post and self.comment:
+        if self.post_id is not None and self.comment_id is not None:
             raise ValidationError("Like cannot be associated with both a post and a comment")
     
     def save(self, *args, **kwargs):
         self.clean()
+        is_new = self._state.adding
         super().save(*args, **kwargs)
+        cache.bump(*cache.post_scopes(self.target_post_id), cache.liked_scope(self.user_id))
+        if is_new:
+            events.like_changed(self.target_post_id, self.comment_id, 1)
+    
+    def delete(self, *args, **kwargs):
+        post_id = self.target_post_id
+        result = super().delete(*args, **kwargs)
+        cache.bump(*cache.post_scopes(post_id), cache.liked_scope(self.user_id))
+        events.like_changed(post_id, self.comment_id, -1)
+        return result
+    
+    @property
+    def target_post_id(self):
+        """The post whose thread displays this like."""
+        return self.post_id if self.post_id else self.comment.post_id
 
 class KarmaTransaction(models.Model):
     SOURCE_TYPES = [
@@ -68,7 +203,8 @@ class KarmaTransaction(models.Model):
     karma = models.IntegerField()
     source_type = models.CharField(max_length=20, choices=SOURCE_TYPES)
     source_id = models.IntegerField()
-    created_at = models.DateTimeField(auto_now_add=True)
+    # Not auto_now_add, so imported or generated history can be backdated.
+    created_at = models.DateTimeField(default=timezone.now)
     
     class Meta:
         indexes = [
@@ -78,3 +214,208 @@ class KarmaTransaction(models.Model):
     
     def __str__(self):
         return f"{self.user.username}: {self.karma} karma ({self.source_type})"
+    
+    def save(self, *args, **kwargs):
+        is_new = self._state.adding
+        # No savepoint: a failure here must roll back the caller's write too.
+        with transaction.atomic(savepoint=False):
+            super().save(*args, **kwargs)
+            if is_new:
+                self.apply_rollups([self])
+    
+    @classmethod
+    def record_many(cls, transactions):
+        """Insert ``transactions`` in bulk and fold them into the rollups."""
+        with transaction.atomic(savepoint=False):
+            created = cls.objects.bulk_create(transactions)
+            cls.apply_rollups(created)
+        return created
+    
+    @staticmethod
+    def apply_rollups(transactions):
+        """Add ``transactions`` to the rollups, one upsert per rollup table."""
+        if not transactions:
+            return
+        totals = {}
+        buckets = {}
+        for txn in transactions:
+            hour = KarmaBucket.truncate(txn.created_at)
+            totals[txn.user_id] = totals.get(txn.user_id, 0) + txn.karma
+            buckets[txn.user_id, hour] = buckets.get((txn.user_id, hour), 0) + txn.karma
+        # Karma for hours that have already slid out of the window would be
+        # subtracted again by the next slide, so it must not be counted there.
+        window_start = LeaderboardWindow.current().window_start
+        window = {}
+        for (user_id, hour), karma in buckets.items():
+            if hour >= window_start:
+                window[user_id] = window.get(user_id, 0) + karma
+        increment_many(UserKarma, ['user_id'], 'total', {(user_id,): karma for user_id, karma in totals.items()})
+        increment_many(KarmaBucket, ['user_id', 'hour'], 'karma', buckets)
+        increment_many(WindowKarma, ['user_id'], 'karma', {(user_id,): karma for user_id, karma in window.items()})
+        cache.bump('leaderboard')
+        events.karma_changed(totals)
+
+
+def increment_many(model, key_fields, field, deltas):
+    """Add ``deltas[key]`` to ``field`` of the row whose ``key_fields`` equal
+    ``key``, creating missing rows, for every key.
+
+    One ``INSERT ... ON CONFLICT DO UPDATE`` per chunk of keys where the
+    database supports it (SQLite 3.24+, PostgreSQL); otherwise
+    ``increment_or_create()`` per key.
+    """
+    deltas = {key: delta for key, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    connection = connections[router.db_for_write(model)]
+    if not connection.features.supports_update_conflicts_with_target:
+        for key, delta in deltas.items():
+            increment_or_create(model, dict(zip(key_fields, key)), **{field: delta})
+        return
+    quote = connection.ops.quote_name
+    table = quote(model._meta.db_table)
+    key_model_fields = [model._meta.get_field(name) for name in key_fields]
+    key_columns = [quote(f.column) for f in key_model_fields]
+    column = quote(model._meta.get_field(field).column)
+    rows = [
+        [f.get_db_prep_save(value, connection) for f, value in zip(key_model_fields, key)] + [delta]
+        for key, delta in deltas.items()
+    ]
+    width = len(key_columns) + 1
+    limit = connection.features.max_query_params
+    size = max(limit // width, 1) if limit else len(rows)
+    for start in range(0, len(rows), size):
+        chunk = rows[start:start + size]
+        placeholders = ', '.join(['(%s)' % ', '.join(['%s'] * width)] * len(chunk))
+        sql = (
+            f"INSERT INTO {table} ({', '.join(key_columns)}, {column}) VALUES {placeholders} "
+            f"ON CONFLICT ({', '.join(key_columns)}) DO UPDATE SET {column} = {table}.{column} + EXCLUDED.{column}"
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [value for row in chunk for value in row])
+
+
+def increment_or_create(model, lookup, **deltas):
+    """Atomically add each of ``deltas`` to its field on the row matching
+    ``lookup``, creating the row if it does not exist yet."""
+    changes = {field: F(field) + delta for field, delta in deltas.items()}
+    if model.objects.filter(**lookup).update(**changes):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**lookup, **deltas)
+    except IntegrityError:
+        # Another writer created the row between our UPDATE and INSERT.
+        model.objects.filter(**lookup).update(**changes)
+
+
+class KarmaDailySummary(models.Model):
+    """Karma a user earned from one source type on one UTC day, folded in
+    from ledger rows that ``feed.compaction`` has removed."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='karma_summaries')
+    day = models.DateField()
+    source_type = models.CharField(max_length=20, choices=KarmaTransaction.SOURCE_TYPES)
+    karma = models.IntegerField(default=0)
+    transactions = models.IntegerField(default=0)
+    
+    class Meta:
+        unique_together = [['user', 'day', 'source_type']]
+        indexes = [
+            models.Index(fields=['day']),
+        ]
+    
+    def __str__(self):
+        return f"{self.user_id} on {self.day:%Y-%m-%d}: {self.karma} karma ({self.source_type})"
+    
+    @classmethod
+    def add(cls, user_id, day, source_type, karma, transactions):
+        increment_or_create(
+            cls, {'user_id': user_id, 'day': day, 'source_type': source_type},
+            karma=karma, transactions=transactions
+        )
+
+
+class UserKarma(models.Model):
+    """Running lifetime karma total per user, kept in step with the ledger."""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='karma')
+    total = models.IntegerField(default=0)
+    
+    def __str__(self):
+        return f"{self.user_id}: {self.total} karma"
+
+
+class KarmaBucket(models.Model):
+    """Karma earned by a user within one clock hour."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='karma_buckets')
+    hour = models.DateTimeField()
+    karma = models.IntegerField(default=0)
+    
+    WINDOW_HOURS = 24
+    
+    class Meta:
+        unique_together = [['user', 'hour']]
+        indexes = [
+            models.Index(fields=['hour']),
+        ]
+    
+    def __str__(self):
+        return f"{self.user_id} @ {self.hour:%Y-%m-%d %H:00}: {self.karma} karma"
+    
+    @staticmethod
+    def truncate(moment):
+        return moment.replace(minute=0, second=0, microsecond=0)
+    
+    @classmethod
+    def window_start(cls, now=None):
+        """First bucket of the rolling 24h window: the current hour plus the 23 before it."""
+        return cls.truncate(now or timezone.now()) - timedelta(hours=cls.WINDOW_HOURS - 1)
+
+
+class LeaderboardWindow(models.Model):
+    """Singleton row recording which hour buckets WindowKarma currently covers."""
+    window_start = models.DateTimeField()
+    
+    def __str__(self):
+        return f"Leaderboard window from {self.window_start:%Y-%m-%d %H:00}"
+    
+    @classmethod
+    def current(cls):
+        window, _ = cls.objects.get_or_create(pk=1, defaults={'window_start': KarmaBucket.window_start()})
+        return window
+
+
+class WindowKarma(models.Model):
+    """Karma per user summed over the buckets in the leaderboard window.
+
+    Rows are incremented as karma is written and decremented as buckets slide
+    out of the window (see ``feed.leaderboard``), so the top of the
+    leaderboard is a short scan of the ``-karma`` index.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='window_karma')
+    karma = models.IntegerField(default=0)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['-karma', 'user']),
+        ]
+    
+    def __str__(self):
+        return f"{self.user_id}: {self.karma} karma in window"
+
+
+class LikeEvent(models.Model):
+    """A like or unlike waiting to be applied by the write-behind flusher."""
+    ACTIONS = [
+        ('like', 'Like'),
+        ('unlike', 'Unlike'),
+    ]
+    
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='like_events')
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, null=True, blank=True, related_name='like_events')
+    comment = models.ForeignKey(Comment, on_delete=models.CASCADE, null=True, blank=True, related_name='like_events')
+    action = models.CharField(max_length=10, choices=ACTIONS)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        target = f"post {self.post_id}" if self.post_id else f"comment {self.comment_id}"
+        return f"{self.user_id} {self.action} {target}"
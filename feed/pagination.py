@@ -0,0 +1,200 @@
+import base64
+import json
+from types import SimpleNamespace
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from . import search
+
+
+class KeysetPagination(BasePagination):
+    """Cursor pagination that seeks on the full ordering key.
+
+    The cursor holds the ordering values of the last row of the previous
+    page, and the next page is fetched with ``WHERE (a, b) < (x, y)`` spelled
+    out as ``a < x OR (a = x AND b < y)``. With an index matching the ordering
+    every page costs the same, unlike OFFSET which scans all skipped rows.
+    The ordering must end in a unique field so the key is a total order.
+    """
+    page_size = 20
+    max_page_size = 100
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    ordering = ('-created_at', '-id')
+    invalid_cursor_message = 'Invalid cursor'
+
+    def get_ordering(self, request, queryset, view):
+        return getattr(view, 'keyset_ordering', self.ordering)
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def paginate_queryset(self, queryset, request, view=None):
+        page = self.page_queryset(queryset, request, view)
+        return self.finish_page(list(page))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        page = self.page_queryset(queryset, request, view)
+        return self.finish_page([row async for row in page])
+
+    def page_queryset(self, queryset, request, view=None):
+        """``queryset`` narrowed to the requested page plus one row to detect a next page."""
+        self.request = request
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.page_size = self.get_page_size(request)
+        self.fields = [self._field(queryset.model, name) for name in self.ordering]
+
+        queryset = queryset.order_by(*self.ordering)
+        position = self.decode_cursor(request, self.fields)
+        if position is not None:
+            queryset = queryset.filter(self._seek(position))
+        return queryset[:self.page_size + 1]
+
+    def paginate_ranked(self, keys, queryset, request, view=None):
+        """A page of ``queryset`` whose order was worked out in Python.
+
+        ``keys`` are the ordering values of every row, already sorted. Only
+        descending orderings, ending in the primary key, are supported.
+        """
+        page = self.page_keys(keys, queryset.model, request, view)
+        rows = {self._pk(row): row for row in queryset.filter(pk__in=[key[-1] for key in page]).order_by()}
+        return self.finish_ranked(page, rows)
+
+    async def apaginate_ranked(self, keys, queryset, request, view=None):
+        page = self.page_keys(keys, queryset.model, request, view)
+        rows = {self._pk(row): row async for row in queryset.filter(pk__in=[key[-1] for key in page]).order_by()}
+        return self.finish_ranked(page, rows)
+
+    def page_keys(self, keys, model, request, view=None):
+        """The requested page of ``keys``, plus one to detect a next page."""
+        self.request = request
+        self.ordering = self.get_ordering(request, None, view)
+        self.page_size = self.get_page_size(request)
+        self.fields = [self._field(model, name) for name in self.ordering]
+        position = self.decode_cursor(request, self.fields)
+        if position is not None:
+            after = tuple(value for name, value in position)
+            keys = [key for key in keys if key < after]
+        return keys[:self.page_size + 1]
+
+    def finish_ranked(self, page, rows):
+        # A post deleted since the keys were read is left out.
+        return self.finish_page([rows[key[-1]] for key in page if key[-1] in rows])
+
+    @staticmethod
+    def _pk(row):
+        return row['id'] if isinstance(row, dict) else row.pk
+
+    def finish_page(self, rows):
+        self.has_next = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        self.next_position = None
+        if self.has_next:
+            last = rows[-1]
+            if isinstance(last, dict):
+                # Rows from .values(); value_to_string() reads attributes.
+                last = SimpleNamespace(**last)
+            self.next_position = [field.value_to_string(last) for field in self.fields]
+        return rows
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.next_position))
+
+    def encode_cursor(self, position):
+        raw = json.dumps(position, separators=(',', ':')).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+    def decode_cursor(self, request, fields):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            padded = encoded + '=' * (-len(encoded) % 4)
+            values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+            if not isinstance(values, list) or len(values) != len(fields):
+                raise ValueError(values)
+            return [(name, field.to_python(value)) for name, field, value in zip(self.ordering, fields, values)]
+        except (TypeError, ValueError, ValidationError) as exc:
+            raise NotFound(self.invalid_cursor_message) from exc
+
+    @staticmethod
+    def _field(model, name):
+        name = name.lstrip('-')
+        return model._meta.pk if name in ('id', 'pk') else model._meta.get_field(name)
+
+    @staticmethod
+    def _seek(position):
+        """Rows strictly after ``position`` in the ordering."""
+        condition = Q()
+        equal = Q()
+        for name, value in position:
+            field = name.lstrip('-')
+            lookup = 'lt' if name.startswith('-') else 'gt'
+            condition |= equal & Q(**{f'{field}__{lookup}': value})
+            equal &= Q(**{field: value})
+        return condition
+
+
+class ThreadPagination(KeysetPagination):
+    """Pages sibling comments in thread order; a comment's path is unique."""
+    ordering = ('path',)
+
+    def get_ordering(self, request, queryset, view):
+        return self.ordering
+
+
+class SearchPagination(KeysetPagination):
+    """Pages ranked search hits on ``(rank, kind, id)``, best first."""
+
+    def paginate_search(self, text, request):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        hits = search.search(text, self.page_size + 1, self.decode_position(request))
+        self.has_next = len(hits) > self.page_size
+        hits = hits[:self.page_size]
+        self.next_position = None
+        if self.has_next:
+            kind, hit_id, rank = hits[-1]
+            self.next_position = [rank, kind, hit_id]
+        return hits
+
+    def decode_position(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            padded = encoded + '=' * (-len(encoded) % 4)
+            rank, kind, hit_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+            if kind not in search.KINDS:
+                raise ValueError(kind)
+            return float(rank), kind, int(hit_id)
+        except (TypeError, ValueError) as exc:
+            raise NotFound(self.invalid_cursor_message) from exc
@@ -0,0 +1,104 @@
+"""Per-view query budgets.
+
+``QueryBudgetMiddleware`` counts the queries each request runs and the time
+they take, keyed by view action (``'PostViewSet.list'``). When a count goes
+over its entry in ``FEED_QUERY_BUDGETS`` it logs a warning, or raises
+``QueryBudgetExceeded`` if ``FEED_QUERY_BUDGET_MODE`` is ``'raise'`` (use that
+in tests and CI). ``'off'`` skips the tracking altogether.
+
+Only queries run before the view returns are counted, so the body of a
+streaming response is not, and neither is anything served through ASGI.
+"""
+import logging
+import time
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+class QueryStats:
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - started
+
+
+@contextmanager
+def track_queries():
+    """Count the queries run on every database connection inside the block."""
+    stats = QueryStats()
+    wrappers = [connections[alias].execute_wrapper(stats) for alias in connections]
+    for wrapper in wrappers:
+        wrapper.__enter__()
+    try:
+        yield stats
+    finally:
+        for wrapper in reversed(wrappers):
+            wrapper.__exit__(None, None, None)
+
+
+def view_name(request):
+    """``'<ViewSet>.<action>'`` for a DRF viewset request, else the view's name."""
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return None
+    view = match.func
+    cls = getattr(view, 'cls', None)
+    if cls is None:
+        return match.view_name
+    actions = getattr(view, 'actions', None) or {}
+    return f"{cls.__name__}.{actions.get(request.method.lower(), request.method.lower())}"
+
+
+def check(name, stats):
+    """Log (or raise, per ``FEED_QUERY_BUDGET_MODE``) if ``name`` went over budget."""
+    budget = getattr(settings, 'FEED_QUERY_BUDGETS', {}).get(name)
+    logger.debug('%s: %d queries in %.1f ms', name, stats.count, stats.seconds * 1000)
+    if budget is None or stats.count <= budget:
+        return
+    message = f'{name} ran {stats.count} queries ({stats.seconds * 1000:.1f} ms), over its budget of {budget}'
+    if getattr(settings, 'FEED_QUERY_BUDGET_MODE', 'log') == 'raise':
+        raise QueryBudgetExceeded(message)
+    logger.warning(message)
+
+
+class QueryBudgetMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if getattr(settings, 'FEED_QUERY_BUDGET_MODE', 'log') == 'off':
+            return self.get_response(request)
+        with track_queries() as stats:
+            response = self.get_response(request)
+        name = view_name(request)
+        if name is not None:
+            check(name, stats)
+        return response
+
+    async def __acall__(self, request):
+        # Under ASGI the ORM runs queries on a worker thread, out of reach of
+        # this task's execute_wrapper, so async requests are not tracked.
+        return await self.get_response(request)
@@ -0,0 +1,141 @@
+"""Query plan checks for the endpoints' queries.
+
+``capture()`` records the SELECTs run while a block executes, ``explain()``
+asks the database how it would run each one, and ``problems()`` picks out
+the plan steps that usually mean a missing index:
+
+* SQLite: ``SCAN <table>`` without an index (a full table scan), ``SCAN
+  <table> USING INDEX`` (a walk of a whole index) and ``USE TEMP B-TREE``
+  (sorting or grouping rows that an index could have returned in order).
+* PostgreSQL: ``Seq Scan`` and ``Sort`` nodes, with sequential scans
+  disabled so that a small test dataset does not make them look cheapest.
+
+An index walk is not reported when the query stops at a ``LIMIT``, needs
+no sort and filters only on columns of that index: it reads the rows of one
+page in key order. A walk that also filters on other columns may read the
+whole table before it fills a page, so it is reported. SQLite shows a walk
+of the table itself in primary key order as a bare ``SCAN <table>``; that
+counts as a walk of an index on ``id`` when the query orders by ``id``.
+Every other full table scan is reported.
+
+``QueryPlanTests`` runs every endpoint against a seeded dataset and fails on
+any of these, so an index that goes missing (or a query that stops using
+one) shows up in the test run rather than in production.
+"""
+import re
+from contextlib import contextmanager
+
+from django.db import connections, transaction
+
+PATTERNS = {
+    'sqlite': {
+        'scan': re.compile(r'^SCAN (?P<table>\w+)$'),
+        'walk': re.compile(r'^SCAN (?P<table>\w+) USING (?:COVERING )?INDEX (?P<index>\w+)'),
+        'sort': re.compile(r'USE TEMP B-TREE'),
+    },
+    'postgresql': {
+        'scan': re.compile(r'Seq Scan on (?P<table>\w+)'),
+        'sort': re.compile(r'^\s*(->\s+)?(Incremental )?Sort\b'),
+    },
+}
+LIMIT = re.compile(r'\bLIMIT\b', re.IGNORECASE)
+ORDER_BY = re.compile(r'\bORDER BY\b(?P<order>.*?)(?:\bLIMIT\b|$)', re.IGNORECASE | re.DOTALL)
+WHERE = re.compile(r'\bWHERE\b(?P<where>.*?)(?:\bGROUP BY\b|\bORDER BY\b|\bLIMIT\b|$)', re.IGNORECASE | re.DOTALL)
+
+
+class Query:
+    def __init__(self, sql, params):
+        self.sql = sql
+        self.params = params
+
+    def __repr__(self):
+        return f'<Query {self.sql[:80]}>'
+
+
+class Recorder:
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        if not many and sql.lstrip().upper().startswith(('SELECT', 'WITH')):
+            self.queries.append(Query(sql, params))
+        return execute(sql, params, many, context)
+
+
+@contextmanager
+def capture(using='default'):
+    """Record the SELECTs run on ``using`` inside the block, in order."""
+    recorder = Recorder()
+    with connections[using].execute_wrapper(recorder):
+        yield recorder.queries
+
+
+def explain(query, using='default'):
+    """The plan of ``query`` as a list of lines."""
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(f'EXPLAIN QUERY PLAN {query.sql}', query.params)
+            return [row[-1] for row in cursor.fetchall()]
+        if connection.vendor == 'postgresql':
+            with transaction.atomic(using=using):
+                cursor.execute('SET LOCAL enable_seqscan = off')
+                cursor.execute(f'EXPLAIN {query.sql}', query.params)
+                return [row[0] for row in cursor.fetchall()]
+    raise NotImplementedError(f'Query plans are not checked on {connection.vendor}')
+
+
+def filtered_columns(sql, table):
+    """Columns of ``table`` that the outer WHERE clause of ``sql`` refers to."""
+    match = WHERE.search(sql)
+    if match is None:
+        return set()
+    return set(re.findall(rf'"{table}"\."(\w+)"', match['where']))
+
+
+def ordered_by_pk(sql, table):
+    match = ORDER_BY.search(sql)
+    return match is not None and re.match(rf'\s*"{table}"\."id"', match['order']) is not None
+
+
+def index_columns(table, index, using='default'):
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        constraints = connection.introspection.get_constraints(cursor, table)
+    # Every SQLite index also holds the rowid, which is the id column.
+    return set(constraints.get(index, {}).get('columns') or []) | {'id'}
+
+
+def problems(query, plan, using='default'):
+    """The lines of ``query``'s ``plan`` that read a whole table or sort in a temporary structure."""
+    connection = connections[using]
+    patterns = PATTERNS[connection.vendor]
+    # Derived tables and CTEs are scanned by name too; only real tables count.
+    tables = set(connection.introspection.table_names())
+    sorts = [line.strip() for line in plan if patterns['sort'].search(line)]
+    paged = LIMIT.search(query.sql) and not sorts
+    scans = []
+    for line in plan:
+        scan = patterns['scan'].search(line)
+        walk = patterns['walk'].search(line) if 'walk' in patterns else None
+        if scan and scan['table'] in tables:
+            table = scan['table']
+            walked = {'id'} if connection.vendor == 'sqlite' and ordered_by_pk(query.sql, table) else None
+        elif walk and walk['table'] in tables:
+            table = walk['table']
+            walked = index_columns(table, walk['index'], using)
+        else:
+            continue
+        if not (paged and walked is not None and filtered_columns(query.sql, table) <= walked):
+            scans.append(line.strip())
+    return scans + sorts
+
+
+def check(queries, using='default'):
+    """``[(query, problems)]`` for each of ``queries`` whose plan has any."""
+    found = []
+    for query in queries:
+        plan_problems = problems(query, explain(query, using), using)
+        if plan_problems:
+            found.append((query, plan_problems))
+    return found
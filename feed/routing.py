@@ -0,0 +1,74 @@
+"""Read replica routing with read-your-writes stickiness.
+
+Reads made by views that use ``ReplicaReadsMixin`` go to one of the
+``FEED_READ_REPLICAS`` aliases; everything else, and every write, goes to
+``default``. A client that sends a write gets a cookie that pins its reads to
+the primary for ``FEED_REPLICA_STICKY_SECONDS``, so it does not see its own
+change disappear while the replicas catch up.
+
+Reads inside a transaction on the primary always stay on the primary, and
+so does anything run outside a routed view (management commands, the body
+of a streaming response).
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+STICKY_COOKIE = 'feed_primary'
+
+# None: not in a routed request; True: reads may use a replica; False: the
+# request is pinned to the primary by a recent write.
+_replica_reads = ContextVar('feed_replica_reads', default=None)
+
+
+def replicas():
+    return getattr(settings, 'FEED_READ_REPLICAS', [])
+
+
+def is_sticky():
+    """Whether the current request is pinned to the primary after a write."""
+    return _replica_reads.get() is False
+
+
+@contextmanager
+def replica_reads(allowed):
+    token = _replica_reads.set(allowed)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if not _replica_reads.get() or not replicas():
+            return DEFAULT_DB_ALIAS
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas())
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary.
+        return True
+
+
+class ReplicaReadsMixin:
+    """Route a viewset's safe requests to the replicas unless the client just wrote."""
+
+    def dispatch(self, request, *args, **kwargs):
+        safe = request.method in ('GET', 'HEAD', 'OPTIONS')
+        if not replicas():
+            return super().dispatch(request, *args, **kwargs)
+        with replica_reads(safe and STICKY_COOKIE not in request.COOKIES):
+            response = super().dispatch(request, *args, **kwargs)
+        if not safe:
+            response.set_cookie(
+                STICKY_COOKIE, '1', max_age=getattr(settings, 'FEED_REPLICA_STICKY_SECONDS', 10), httponly=True
+            )
+        return response
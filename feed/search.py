@@ -0,0 +1,231 @@
+"""Full-text search over post titles, post content and comments.
+
+The index lives in the database and is kept current by triggers (see
+migration ``0010_search_index``), so every write path, bulk inserts
+included, updates it in the same transaction:
+
+* SQLite: FTS5 tables ``feed_post_fts`` and ``feed_comment_fts``, ranked by
+  bm25 with titles weighted ``TITLE_WEIGHT`` times content.
+* PostgreSQL: a ``search_vector`` tsvector column on ``feed_post`` and
+  ``feed_comment`` with GIN indexes, ranked by ``ts_rank_cd`` with titles in
+  weight class A.
+
+Every term must match (stemmed, case-insensitive). Hits from both tables are
+merged into one ranking, best first, and paged with a cursor on
+``(rank, kind, id)``. ``rebuild()`` re-indexes everything in batches.
+
+On SQLite, a migration that rebuilds ``feed_post`` or ``feed_comment`` (as
+adding a column with a default does) drops their triggers.
+``restore_triggers()`` re-creates any that are missing after every
+``migrate`` (see ``FeedConfig.ready``), so such a migration needs no
+hand-written restore step.
+"""
+import re
+
+from django.db import connections, router, transaction
+
+from . import fastpath
+from .models import Post, Comment
+
+MAX_TERMS = 16
+TITLE_WEIGHT = 10.0
+BATCH_SIZE = 1000
+KINDS = ('comment', 'post')
+
+SEEK = 'WHERE rank < %s OR (rank = %s AND (kind > %s OR (kind = %s AND id > %s)))'
+
+SEARCH_SQL = {
+    'sqlite': f"""
+        SELECT kind, id, rank FROM (
+            SELECT 'comment' AS kind, rowid AS id, -bm25(feed_comment_fts) AS rank
+            FROM feed_comment_fts WHERE feed_comment_fts MATCH %s
+            UNION ALL
+            SELECT 'post', rowid, -bm25(feed_post_fts, {TITLE_WEIGHT}, 1.0)
+            FROM feed_post_fts WHERE feed_post_fts MATCH %s
+        ) AS hits
+        {{seek}}
+        ORDER BY rank DESC, kind, id
+        LIMIT %s
+    """,
+    'postgresql': """
+        SELECT kind, id, rank FROM (
+            SELECT 'comment' AS kind, id, ts_rank_cd(search_vector, query)::float8 AS rank
+            FROM feed_comment, plainto_tsquery('english', %s) AS query WHERE search_vector @@ query
+            UNION ALL
+            SELECT 'post', id, ts_rank_cd(search_vector, query)::float8
+            FROM feed_post, plainto_tsquery('english', %s) AS query WHERE search_vector @@ query
+        ) AS hits
+        {seek}
+        ORDER BY rank DESC, kind, id
+        LIMIT %s
+    """,
+}
+
+
+def terms(text):
+    """The words of a search query, lowercased; punctuation and operators are dropped."""
+    return re.findall(r'\w+', text.lower())[:MAX_TERMS]
+
+
+def match_expression(vendor, words):
+    if vendor == 'sqlite':
+        # Quoted, so FTS5 reads each word as a plain term.
+        return ' '.join(f'"{word}"' for word in words)
+    return ' '.join(words)
+
+
+def supported(vendor):
+    return vendor in SEARCH_SQL
+
+
+def search(text, limit, after=None):
+    """Up to ``limit`` ``(kind, id, rank)`` hits for ``text``, best first.
+
+    ``after`` is the ``(rank, kind, id)`` of the last hit of the previous page.
+    """
+    words = terms(text)
+    if not words:
+        return []
+    connection = connections[router.db_for_read(Post)]
+    query = match_expression(connection.vendor, words)
+    params = [query, query]
+    seek = ''
+    if after is not None:
+        rank, kind, hit_id = after
+        seek = SEEK
+        params += [rank, rank, kind, kind, hit_id]
+    with connection.cursor() as cursor:
+        cursor.execute(SEARCH_SQL[connection.vendor].format(seek=seek), params + [limit])
+        return cursor.fetchall()
+
+
+def render(hits):
+    """Serialize ``(kind, id, rank)`` hits.
+
+    Posts look as in the post list minus ``comments``, comments as in the
+    comment detail minus ``replies``.
+    """
+    post_ids = [hit_id for kind, hit_id, rank in hits if kind == 'post']
+    comment_ids = [hit_id for kind, hit_id, rank in hits if kind == 'comment']
+    posts = list(fastpath.post_rows(Post.objects.filter(id__in=post_ids))) if post_ids else []
+    comments = fastpath.comment_rows(Comment.objects.filter(id__in=comment_ids)) if comment_ids else []
+    authors = fastpath.load_authors(fastpath.referenced_authors(posts, comments))
+
+    items = {}
+    for post in fastpath.shape_posts(posts, [], authors):
+        del post['comments']
+        items['post', post['id']] = post
+    for row in comments:
+        comment = fastpath.comment_node(row, authors)
+        del comment['replies']
+        items['comment', comment['id']] = comment
+    # A hit whose row was deleted since the search ran is left out.
+    return [
+        {'type': kind, 'rank': rank, **items[kind, hit_id]}
+        for kind, hit_id, rank in hits if (kind, hit_id) in items
+    ]
+
+
+# The same triggers as migration 0010_search_index creates, made safe to re-run.
+SQLITE_TRIGGERS = {
+    'feed_post_fts_insert': """CREATE TRIGGER IF NOT EXISTS feed_post_fts_insert AFTER INSERT ON feed_post BEGIN
+        INSERT INTO feed_post_fts(rowid, title, content) VALUES (new.id, new.title, new.content);
+    END""",
+    'feed_post_fts_delete': """CREATE TRIGGER IF NOT EXISTS feed_post_fts_delete AFTER DELETE ON feed_post BEGIN
+        DELETE FROM feed_post_fts WHERE rowid = old.id;
+    END""",
+    'feed_post_fts_update': """CREATE TRIGGER IF NOT EXISTS feed_post_fts_update AFTER UPDATE OF title, content ON feed_post BEGIN
+        DELETE FROM feed_post_fts WHERE rowid = old.id;
+        INSERT INTO feed_post_fts(rowid, title, content) VALUES (new.id, new.title, new.content);
+    END""",
+    'feed_comment_fts_insert': """CREATE TRIGGER IF NOT EXISTS feed_comment_fts_insert AFTER INSERT ON feed_comment BEGIN
+        INSERT INTO feed_comment_fts(rowid, content) VALUES (new.id, new.content);
+    END""",
+    'feed_comment_fts_delete': """CREATE TRIGGER IF NOT EXISTS feed_comment_fts_delete AFTER DELETE ON feed_comment BEGIN
+        DELETE FROM feed_comment_fts WHERE rowid = old.id;
+    END""",
+    'feed_comment_fts_update': """CREATE TRIGGER IF NOT EXISTS feed_comment_fts_update AFTER UPDATE OF content ON feed_comment BEGIN
+        DELETE FROM feed_comment_fts WHERE rowid = old.id;
+        INSERT INTO feed_comment_fts(rowid, content) VALUES (new.id, new.content);
+    END""",
+}
+
+
+def sqlite_triggers(using='default'):
+    """Names of the search triggers present on ``using``."""
+    with connections[using].cursor() as cursor:
+        placeholders = ', '.join(['%s'] * len(SQLITE_TRIGGERS))
+        cursor.execute(
+            f"SELECT name FROM sqlite_master WHERE type = 'trigger' AND name IN ({placeholders})", list(SQLITE_TRIGGERS)
+        )
+        return {row[0] for row in cursor.fetchall()}
+
+
+def restore_triggers(using='default'):
+    """Re-create whichever SQLite search triggers a table rebuild dropped; returns their names.
+
+    Rows written while a trigger was missing are not in the index; run
+    ``rebuild_search_index`` if any were restored.
+    """
+    connection = connections[using]
+    if connection.vendor != 'sqlite' or 'feed_post_fts' not in connection.introspection.table_names():
+        return set()
+    missing = set(SQLITE_TRIGGERS) - sqlite_triggers(using)
+    with connection.cursor() as cursor:
+        for name in sorted(missing):
+            cursor.execute(SQLITE_TRIGGERS[name])
+    return missing
+
+
+def _batches(queryset, batch_size, upto):
+    """``(after, last, rows)`` for consecutive id ranges ``(after, last]`` up to ``upto``.
+
+    Each range holds at most ``batch_size`` rows.
+    """
+    after = 0
+    while after < upto:
+        ids = list(queryset.filter(id__gt=after, id__lte=upto).order_by('id').values_list('id', flat=True)[:batch_size])
+        last = ids[-1] if len(ids) == batch_size else upto
+        yield after, last, len(ids)
+        after = last
+
+
+REBUILD_SQL = {
+    'sqlite': {
+        Post: [
+            'DELETE FROM feed_post_fts WHERE rowid > %s AND rowid <= %s',
+            'INSERT INTO feed_post_fts(rowid, title, content) '
+            'SELECT id, title, content FROM feed_post WHERE id > %s AND id <= %s',
+        ],
+        Comment: [
+            'DELETE FROM feed_comment_fts WHERE rowid > %s AND rowid <= %s',
+            'INSERT INTO feed_comment_fts(rowid, content) '
+            'SELECT id, content FROM feed_comment WHERE id > %s AND id <= %s',
+        ],
+    },
+    'postgresql': {
+        # Naming the columns in SET fires the BEFORE UPDATE OF trigger,
+        # which recomputes search_vector; the values themselves are unchanged.
+        Post: ['UPDATE feed_post SET title = title WHERE id > %s AND id <= %s'],
+        Comment: ['UPDATE feed_comment SET content = content WHERE id > %s AND id <= %s'],
+    },
+}
+
+
+def rebuild(batch_size=BATCH_SIZE, using='default'):
+    """Re-index every post and comment in place, one transaction per batch.
+
+    Yields ``(model, rows)`` after each batch. Searches keep working
+    throughout, and rows written meanwhile are indexed by the triggers.
+    """
+    connection = connections[using]
+    if not supported(connection.vendor):
+        raise NotImplementedError(f'Search is not supported on {connection.vendor}')
+    for model, statements in REBUILD_SQL[connection.vendor].items():
+        queryset = model.objects.using(using)
+        upto = queryset.order_by('-id').values_list('id', flat=True).first() or 0
+        for after, last, rows in _batches(queryset, batch_size, upto):
+            with transaction.atomic(using=using), connection.cursor() as cursor:
+                for statement in statements:
+                    cursor.execute(statement, [after, last])
+            yield model, rows
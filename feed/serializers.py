@@ -1,7 +1,23 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
-from django.db.models import Sum
-from .models import Post, Comment, Like, KarmaTransaction
+from django.db.models import Sum, Prefetch
+from .models import Post, Comment, Like, KarmaTransaction, UserKarma, KarmaBucket
+
+
+def with_karma(queryset, user_path=''):
+    """Load the karma rollups UserSerializer reads for the users at ``user_path``.
+
+    ``user_path`` is the lookup from the queryset's model to ``User`` (e.g.
+    ``'author'``), or empty when the queryset is over ``User`` itself.
+    """
+    prefix = f'{user_path}__' if user_path else ''
+    return queryset.select_related(f'{prefix}karma').prefetch_related(
+        Prefetch(
+            f'{prefix}karma_buckets',
+            queryset=KarmaBucket.objects.filter(hour__gte=KarmaBucket.window_start()),
+            to_attr='recent_karma_buckets'
+        )
+    )
 
 class UserSerializer(serializers.ModelSerializer):
     total_karma = serializers.SerializerMethodField()
@@ -12,55 +28,104 @@ class UserSerializer(serializers.ModelSerializer):
         fields = ['id', 'username', 'total_karma', 'daily_karma']
     
     def get_total_karma(self, obj):
-        return obj.karma_transactions.aggregate(total=Sum('karma'))['total'] or 0
+        try:
+            return obj.karma.total
+        except UserKarma.DoesNotExist:
+            return 0
     
     def get_daily_karma(self, obj):
-        from django.utils import timezone
-        from datetime import timedelta
+        buckets = getattr(obj, 'recent_karma_buckets', None)
+        if buckets is not None:
+            return sum(bucket.karma for bucket in buckets)
         
-        twenty_four_hours_ago = timezone.now() - timedelta(hours=24)
-        daily_karma = obj.karma_transactions.filter(
-            created_at__gte=twenty_four_hours_ago
+        return obj.karma_buckets.filter(
+            hour__gte=KarmaBucket.window_start()
         ).aggregate(total=Sum('karma'))['total'] or 0
-        
-        return daily_karma
+
+def build_thread(comments):
+    """Link comments loaded in path order into a tree.
+
+    Each comment gets a ``thread_replies`` list that CommentSerializer reads
+    instead of querying ``replies``. Returns the comments whose parent is not
+    part of ``comments`` (the roots of the loaded thread).
+    """
+    by_id = {}
+    roots = []
+    for comment in comments:
+        comment.thread_replies = []
+        by_id[comment.id] = comment
+        parent = by_id.get(comment.parent_id)
+        if parent is None:
+            roots.append(comment)
+        else:
+            parent.thread_replies.append(comment)
+    return roots
 
 class CommentSerializer(serializers.ModelSerializer):
     author = UserSerializer(read_only=True)
-    likes_count = serializers.SerializerMethodField()
+    liked_by_me = serializers.SerializerMethodField()
     replies = serializers.SerializerMethodField()
     
     class Meta:
         model = Comment
-        fields = ['id', 'author', 'content', 'created_at', 'likes_count', 'parent', 'post', 'replies']
-        read_only_fields = ['author', 'likes_count']
+        fields = [
+            'id', 'author', 'content', 'created_at', 'likes_count', 'replies_count', 'parent', 'post', 'liked_by_me',
+            'replies'
+        ]
+        read_only_fields = ['author', 'likes_count', 'replies_count']
     
-    def get_likes_count(self, obj):
-        return obj.comment_likes.count()
+    def get_liked_by_me(self, obj):
+        # The same for every viewer, so the payload can be cached; the
+        # views fill it in with feed.liked.flag.
+        return False
     
     def get_replies(self, obj):
-        serializer = CommentSerializer(obj.replies.all(), many=True, context=self.context)
+        replies = getattr(obj, 'thread_replies', None)
+        if replies is None:
+            replies = obj.replies.all()
+        serializer = self.__class__(replies, many=True, context=self.context)
         return serializer.data
 
+class ThreadCommentSerializer(CommentSerializer):
+    """Comment in a depth-limited page of a thread.
+
+    Comments at the depth limit whose replies were not loaded carry a
+    ``more_replies`` link to the next level down.
+    """
+    more_replies = serializers.SerializerMethodField()
+    
+    class Meta(CommentSerializer.Meta):
+        fields = CommentSerializer.Meta.fields + ['more_replies']
+    
+    def get_more_replies(self, obj):
+        if obj.depth < self.context['max_depth'] or not obj.replies_count:
+            return None
+        request = self.context['request']
+        url = request.build_absolute_uri(request.path)
+        return f"{url}?parent={obj.id}&depth={self.context['depth']}"
+
 class PostSerializer(serializers.ModelSerializer):
     author = UserSerializer(read_only=True)
-    likes_count = serializers.SerializerMethodField()
-    comments_count = serializers.SerializerMethodField()
+    liked_by_me = serializers.SerializerMethodField()
     comments = serializers.SerializerMethodField()
     
     class Meta:
         model = Post
-        fields = ['id', 'title', 'content', 'author', 'created_at', 'likes_count', 'comments_count', 'comments']
+        fields = [
+            'id', 'title', 'content', 'author', 'created_at', 'likes_count', 'comments_count', 'liked_by_me', 'comments'
+        ]
         read_only_fields = ['author', 'likes_count', 'comments_count']
     
-    def get_likes_count(self, obj):
-        return obj.likes.count()
-    
-    def get_comments_count(self, obj):
-        return obj.comments.count()
+    def get_liked_by_me(self, obj):
+        # Filled in per viewer by feed.liked.flag, as for comments.
+        return False
     
     def get_comments(self, obj):
-        top_level = obj.comments.filter(parent=None)
+        thread = getattr(obj, 'thread', None)
+        if thread is not None:
+            top_level = build_thread(thread)
+        else:
+            top_level = obj.comments.filter(parent=None)
         return CommentSerializer(top_level, many=True, context=self.context).data
 
 class LikeSerializer(serializers.ModelSerializer):
@@ -71,6 +136,19 @@ class LikeSerializer(serializers.ModelSerializer):
         fields = ['id', 'user', 'post', 'comment', 'created_at']
         read_only_fields = ['user', 'created_at']
 
+class LikeActionSerializer(serializers.Serializer):
+    action = serializers.ChoiceField(choices=['like', 'unlike'])
+    post = serializers.IntegerField(required=False)
+    comment = serializers.IntegerField(required=False)
+    
+    def validate(self, attrs):
+        if ('post' in attrs) == ('comment' in attrs):
+            raise serializers.ValidationError("Give exactly one of post or comment")
+        return attrs
+
+class LikeBatchSerializer(serializers.Serializer):
+    actions = LikeActionSerializer(many=True, allow_empty=False, max_length=500)
+
 class KarmaTransactionSerializer(serializers.ModelSerializer):
     class Meta:
         model = KarmaTransaction
@@ -0,0 +1,97 @@
+"""Streaming JSON for the whole feed and for whole comment threads.
+
+Rows are read with ``.iterator(chunk_size=...)`` and encoded as they arrive,
+so a worker holds one chunk of rows (plus the authors seen so far) instead
+of the full nested response (on PostgreSQL the rows come from a server-side
+cursor). The JSON matches what ``feed.fastpath`` builds; it is encoded with
+orjson when that is installed.
+"""
+import json
+from itertools import islice
+
+from django.http import StreamingHttpResponse
+
+from . import fastpath
+from . import liked
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+CHUNK_SIZE = 500
+
+
+def dumps(value):
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, separators=(',', ':'), default=_default).encode()
+
+
+def _default(value):
+    # Match orjson, which writes datetimes and dates as ISO 8601.
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def response(chunks):
+    return StreamingHttpResponse(chunks, content_type='application/json')
+
+
+def iter_posts(queryset, preview_size, chunk_size=CHUNK_SIZE, viewer_id=None):
+    """Encode ``queryset``'s posts, each with its comment preview, as one JSON array.
+
+    ``liked_by_me`` is flagged for ``viewer_id`` with one query per chunk.
+    """
+    yield b'['
+    separator = b''
+    rows = fastpath.post_rows(queryset).iterator(chunk_size=chunk_size)
+    for chunk in chunked(rows, chunk_size):
+        for post in liked.flag(viewer_id, fastpath.render_post_list(chunk, preview_size), 'post'):
+            yield separator + dumps(post)
+            separator = b','
+    yield b']'
+
+
+def iter_thread(queryset, chunk_size=CHUNK_SIZE, viewer_id=None):
+    """Encode the comments in ``queryset`` as a JSON array of nested trees.
+
+    ``queryset`` must hold whole subtrees (every comment's parent is either
+    in it or above all of it). Comments are read in path order, which is
+    depth first, so each one is written as soon as it is read with its
+    ``replies`` list left open, and closed once the walk climbs back past it.
+    ``liked_by_me`` is flagged for ``viewer_id`` with one query per chunk.
+    """
+    authors = {}
+    open_depths = []
+    separator = b''
+    yield b'['
+    rows = queryset.order_by('path').values_list(*fastpath.COMMENT_FIELDS, 'depth').iterator(
+        chunk_size=chunk_size
+    )
+    for chunk in chunked(rows, chunk_size):
+        authors.update(fastpath.load_authors({row[1] for row in chunk} - authors.keys()))
+        liked_ids = liked.lookup(viewer_id, comment_ids=[row[0] for row in chunk])['comment']
+        for row in chunk:
+            depth = row[-1]
+            while open_depths and open_depths[-1] >= depth:
+                open_depths.pop()
+                yield b']}'
+                separator = b','
+            node = fastpath.comment_node(row[:-1], authors)
+            node['liked_by_me'] = node['id'] in liked_ids
+            del node['replies']
+            yield separator + dumps(node)[:-1] + b',"replies":['
+            open_depths.append(depth)
+            separator = b''
+    yield b']}' * len(open_depths) + b']'
@@ -0,0 +1,132 @@
+"""Synthetic datasets for benchmarking.
+
+Everything is written with ``bulk_create``, and the denormalized columns
+(counters, hot scores, comment paths, karma rollups) are computed up front instead of
+through the per-row ``save()`` hooks, so large datasets load in minutes.
+The generated users are new, which is what lets the rollups be inserted
+rather than incremented.
+"""
+import random
+import time
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+
+from . import cache, ranking
+from .likes import POST_LIKE_KARMA
+from .models import (
+    Post, Comment, Like, KarmaTransaction, KarmaBucket, LeaderboardWindow, UserKarma, WindowKarma,
+    comment_path_segment,
+)
+
+BATCH_SIZE = 2000
+
+
+def generate(users=100, posts=1000, fanout=3, depth=3, likes_per_post=10, karma_hours=72, seed=None,
+             batch_size=BATCH_SIZE):
+    """Create a dataset and return how many rows of each kind were written.
+
+    Every post gets ``fanout`` top-level comments, each of which has
+    ``fanout`` replies, down to ``depth`` levels. Each post is liked by
+    ``likes_per_post`` distinct users, and the karma for those likes is
+    spread over the last ``karma_hours`` hours.
+    """
+    rng = random.Random(seed)
+    tag = f'{time.time_ns():x}'
+    likes_per_post = min(likes_per_post, users)
+    comments_per_post = sum(fanout ** level for level in range(1, depth + 1))
+
+    with transaction.atomic():
+        password = make_password(None)
+        user_ids = [user.id for user in User.objects.bulk_create(
+            [User(username=f'bench_{tag}_{i}', password=password) for i in range(users)], batch_size=batch_size
+        )]
+
+        post_objs = Post.objects.bulk_create([
+            Post(
+                title=f'Benchmark post {i}',
+                content='Lorem ipsum dolor sit amet. ' * 8,
+                author_id=rng.choice(user_ids),
+                likes_count=likes_per_post,
+                comments_count=comments_per_post,
+                hot_score=ranking.hot_score(likes_per_post, comments_per_post, timezone.now()),
+            )
+            for i in range(posts)
+        ], batch_size=batch_size)
+
+        comment_count = 0
+        parents = [(post.id, None) for post in post_objs]
+        for level in range(depth):
+            children = Comment.objects.bulk_create([
+                Comment(
+                    post_id=post_id,
+                    parent=parent,
+                    author_id=rng.choice(user_ids),
+                    content=f'Reply at depth {level}',
+                    depth=level,
+                    replies_count=fanout if level < depth - 1 else 0,
+                )
+                for post_id, parent in parents
+                for i in range(fanout)
+            ], batch_size=batch_size)
+            for comment in children:
+                comment.path = (comment.parent.path if comment.parent else '') + comment_path_segment(comment.id)
+            Comment.objects.bulk_update(children, ['path'], batch_size=batch_size)
+            comment_count += len(children)
+            parents = [(comment.post_id, comment) for comment in children]
+
+        now = timezone.now()
+        likes = []
+        karma = []
+        for post in post_objs:
+            for user_id in rng.sample(user_ids, likes_per_post):
+                likes.append(Like(user_id=user_id, post_id=post.id))
+                karma.append(KarmaTransaction(
+                    user_id=post.author_id,
+                    karma=POST_LIKE_KARMA,
+                    source_type='post_like',
+                    source_id=post.id,
+                    created_at=now - timedelta(seconds=rng.uniform(0, karma_hours * 3600)),
+                ))
+        Like.objects.bulk_create(likes, batch_size=batch_size)
+        KarmaTransaction.objects.bulk_create(karma, batch_size=batch_size)
+        insert_rollups(karma, batch_size)
+
+    cache.bump('feed', 'leaderboard')
+    return {
+        'users': len(user_ids),
+        'posts': len(post_objs),
+        'comments': comment_count,
+        'likes': len(likes),
+        'karma_transactions': len(karma),
+    }
+
+
+def insert_rollups(transactions, batch_size=BATCH_SIZE):
+    """Insert the karma rollups for ``transactions``, whose users have none yet."""
+    totals = {}
+    buckets = {}
+    for txn in transactions:
+        hour = KarmaBucket.truncate(txn.created_at)
+        totals[txn.user_id] = totals.get(txn.user_id, 0) + txn.karma
+        buckets[txn.user_id, hour] = buckets.get((txn.user_id, hour), 0) + txn.karma
+
+    window_start = LeaderboardWindow.current().window_start
+    in_window = {}
+    for (user_id, hour), karma in buckets.items():
+        if hour >= window_start:
+            in_window[user_id] = in_window.get(user_id, 0) + karma
+
+    UserKarma.objects.bulk_create(
+        [UserKarma(user_id=user_id, total=total) for user_id, total in totals.items()], batch_size=batch_size
+    )
+    KarmaBucket.objects.bulk_create(
+        [KarmaBucket(user_id=user_id, hour=hour, karma=karma) for (user_id, hour), karma in buckets.items()],
+        batch_size=batch_size
+    )
+    WindowKarma.objects.bulk_create(
+        [WindowKarma(user_id=user_id, karma=karma) for user_id, karma in in_window.items()], batch_size=batch_size
+    )
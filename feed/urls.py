@@ -1,13 +1,23 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from . import views
+from . import async_views
 
 router = DefaultRouter()
 router.register(r'posts', views.PostViewSet)
 router.register(r'comments', views.CommentViewSet)
 router.register(r'users', views.UserViewSet, basename='user')
+router.register(r'likes', views.LikeViewSet, basename='like')
+router.register(r'export', views.ExportViewSet, basename='export')
+router.register(r'search', views.SearchViewSet, basename='search')
 
 urlpatterns = [
     path('', include(router.urls)),
     path('leaderboard/', views.UserViewSet.as_view({'get': 'leaderboard'}), name='leaderboard'),
+    path('events/', views.event_stream, name='events'),
+    path('async/posts/', async_views.post_list, name='async-post-list'),
+    path('async/posts/<int:pk>/', async_views.post_detail, name='async-post-detail'),
+    path('async/posts/<int:pk>/comments/', async_views.post_thread, name='async-post-thread'),
+    path('async/leaderboard/', async_views.leaderboard, name='async-leaderboard'),
+    path('async/events/', async_views.event_stream, name='async-events'),
 ]
@@ -1,27 +1,162 @@
+from django.conf import settings
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_safe
 from django.db import transaction
 from django.utils import timezone
 from datetime import timedelta
-from django.db.models import Count, Sum, Q, Prefetch
+from django.db.models import Count, Sum, Q, F, Prefetch
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticatedOrReadOnly, AllowAny
+from rest_framework.permissions import IsAuthenticatedOrReadOnly, AllowAny, IsAdminUser
 from django.contrib.auth.models import User
-from .models import Post, Comment, Like, KarmaTransaction
-from .serializers import PostSerializer, CommentSerializer, LikeSerializer, UserSerializer
+from .models import Post, Comment, subtree_range
+from . import cache as response_cache
+from .conditional import conditional, scope_validators
+from .leaderboard import top_user_ids, validators as leaderboard_validators
+from .pagination import KeysetPagination, ThreadPagination, SearchPagination
+from .routing import ReplicaReadsMixin
+from .serializers import (
+    PostSerializer, CommentSerializer, ThreadCommentSerializer, LikeSerializer, LikeBatchSerializer, UserSerializer,
+    build_thread, with_karma
+)
+from .likes import apply_batch, toggle
+from . import likequeue
+from . import fastpath
+from . import streaming
+from . import export
+from . import events
+from . import search
+from . import ranking
+from . import liked
 
-class PostViewSet(viewsets.ModelViewSet):
+def acting_user(request):
+    """Who a like is written for: the logged-in user, else the first user."""
+    if request.user and request.user.is_authenticated:
+        return request.user
+    return User.objects.first()  # Temporary: use first user
+
+class LikeActionsMixin:
+    """``like`` and ``unlike`` actions for the viewset's ``like_kind`` of target.
+
+    Each is one conditional insert or delete (see ``feed.likes``); liking
+    twice or unliking something not liked is a 400 and changes nothing.
+    """
+    like_kind = None
+    like_errors = {
+        'already_liked': 'Already liked',
+        'not_liked': 'Not liked',
+    }
+    
+    @action(detail=True, methods=['post'])
+    def like(self, request, pk=None):
+        return self.apply_like('like', pk)
+    
+    @action(detail=True, methods=['post'])
+    def unlike(self, request, pk=None):
+        return self.apply_like('unlike', pk)
+    
+    def apply_like(self, action, pk):
+        user = acting_user(self.request)
+        name = self.like_kind.title()
+        try:
+            target_id = int(pk)
+        except ValueError:
+            raise NotFound()
+        
+        if likequeue.write_behind(user.id, self.like_kind, target_id):
+            likequeue.enqueue(user, action, **{self.like_kind: self.get_object()})
+            return Response({'message': f'{name} {action} queued'}, status=status.HTTP_202_ACCEPTED)
+        
+        result = toggle(user, action, self.like_kind, target_id)
+        if result == 'not_found':
+            raise NotFound()
+        if result in self.like_errors:
+            return Response({'error': self.like_errors[result]}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(
+            {'message': f'{name} {result} successfully'},
+            status=status.HTTP_201_CREATED if result == 'liked' else status.HTTP_200_OK
+        )
+
+class PostViewSet(LikeActionsMixin, ReplicaReadsMixin, viewsets.ModelViewSet):
     queryset = Post.objects.all().order_by('-created_at')
     serializer_class = PostSerializer
     permission_classes = [AllowAny]
+    pagination_class = KeysetPagination
+    keyset_ordering = ('-created_at', '-id')
+    like_kind = 'post'
+    comment_preview_size = 3
+    thread_depth = 3
+    max_thread_depth = 10
+    stream_chunk_size = streaming.CHUNK_SIZE
     
     def get_queryset(self):
-        return Post.objects.select_related('author').prefetch_related(
-            Prefetch('comments', queryset=Comment.objects.select_related('author').filter(parent=None)),
-            Prefetch('comments__replies', queryset=Comment.objects.select_related('author')),
-            'likes'
+        if self.action in ('like', 'unlike', 'comments', 'stream_comments'):
+            return Post.objects.all()
+        
+        comments = with_karma(Comment.objects.all(), 'author').order_by('path')
+        if self.action == 'list':
+            # The feed only previews the first few top-level comments of each
+            # post; the rest of the thread is loaded through `comments`.
+            comments = comments.filter(parent=None)[:self.comment_preview_size]
+        # Otherwise the whole thread of the post comes back in one query
+        # ordered by the materialized path and is linked into a tree in the
+        # serializer.
+        return with_karma(self.in_window(Post.objects.all()), 'author').prefetch_related(
+            Prefetch('comments', queryset=comments, to_attr='thread')
         )
     
+    @conditional(lambda view, request, *args, **kwargs: ranking.validators(request.query_params))
+    def list(self, request, *args, **kwargs):
+        try:
+            self.keyset_ordering, self.created_since = ranking.feed_order(request.query_params)
+        except ValueError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        key = response_cache.resource_key('post-list', request.build_absolute_uri(), self.created_since)
+        data = response_cache.get_or_build(key, response_cache.get_version('feed'), self.build_list)
+        # Cached pages are shared by every viewer; their likes go on last.
+        return Response(liked.flag_page(liked.viewer_id(request.user), data, 'post'))
+    
+    @conditional(lambda view, request, *args, **kwargs: scope_validators(f"post:{kwargs['pk']}"))
+    def retrieve(self, request, *args, **kwargs):
+        pk = self.kwargs['pk']
+        key = response_cache.resource_key('post-detail', pk)
+        data = response_cache.get_or_build(key, response_cache.get_version(f'post:{pk}'), self.build_detail)
+        return Response(liked.flag(liked.viewer_id(request.user), [data], 'post')[0])
+    
+    def build_list(self):
+        if not settings.FEED_FAST_READS:
+            return super().list(self.request).data
+        page = self.paginate_queryset(fastpath.post_rows(self.in_window(Post.objects.all())))
+        data = fastpath.render_post_list(page, self.comment_preview_size)
+        return self.get_paginated_response(data).data
+    
+    def paginate_queryset(self, queryset):
+        since = getattr(self, 'created_since', None)
+        if since is None:
+            return super().paginate_queryset(queryset)
+        # A windowed ?sort=top is ranked in Python; see feed.ranking.
+        keys = ranking.window_keys(Post.objects.all(), since)
+        return self.paginator.paginate_ranked(keys, queryset, self.request, view=self)
+    
+    def in_window(self, queryset):
+        """``queryset`` limited to the posts created in the ``?sort=top`` window, if any."""
+        since = getattr(self, 'created_since', None)
+        return queryset.filter(created_at__gte=since) if since else queryset
+    
+    def build_detail(self):
+        if not settings.FEED_FAST_READS:
+            return super().retrieve(self.request, pk=self.kwargs['pk']).data
+        try:
+            pk = int(self.kwargs['pk'])
+        except ValueError:
+            raise NotFound()
+        data = fastpath.render_post_detail(pk)
+        if data is None:
+            raise NotFound()
+        return data
+    
     def perform_create(self, serializer):
         # For now, use first user or create one
         user = User.objects.first()
@@ -29,49 +164,114 @@ class PostViewSet(viewsets.ModelViewSet):
             user = User.objects.create_user('testuser', 'test@test.com', 'password')
         serializer.save(author=user)
     
-    @action(detail=True, methods=['post'])
-    def like(self, request, pk=None):
+    @action(detail=True, methods=['get'])
+    @conditional(lambda view, request, pk=None: scope_validators(f'post:{pk}'))
+    def comments(self, request, pk=None):
+        """One page of a post's thread, optionally below ``?parent=``, at most ``?depth=`` levels deep."""
         post = self.get_object()
-        user = User.objects.first()  # Temporary: use first user
+        try:
+            depth = int(request.query_params.get('depth', self.thread_depth))
+            parent_id = int(request.query_params['parent']) if request.query_params.get('parent') else None
+        except ValueError:
+            return Response({'error': 'parent and depth must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+        depth = max(1, min(depth, self.max_thread_depth))
         
-        with transaction.atomic():
-            if Like.objects.filter(user=user, post=post).exists():
-                return Response({'error': 'Already liked'}, status=status.HTTP_400_BAD_REQUEST)
-            
-            Like.objects.create(user=user, post=post)
-            
-            KarmaTransaction.objects.create(
-                user=post.author,
-                karma=5,
-                source_type='post_like',
-                source_id=post.id
-            )
+        if parent_id is not None and not Comment.objects.filter(pk=parent_id, post=post).exists():
+            raise NotFound('Comment not found')
+        
+        paginator = ThreadPagination()
+        roots = paginator.paginate_queryset(
+            with_karma(Comment.objects.filter(post=post, parent_id=parent_id), 'author'), request
+        )
+        descendants = []
+        if roots:
+            # Every descendant of the page's roots sorts between the first
+            # root's path and the end of the last root's prefix range.
+            root_depth = roots[0].depth
+            descendants = with_karma(Comment.objects.filter(
+                post=post,
+                path__gt=roots[0].path,
+                path__lt=roots[-1].path[:-1] + '0',
+                depth__gt=root_depth,
+                depth__lt=root_depth + depth,
+            ), 'author').order_by('path')
+        build_thread([*roots, *descendants])
         
-        return Response({'message': 'Post liked successfully'}, status=status.HTTP_201_CREATED)
+        serializer = ThreadCommentSerializer(roots, many=True, context={
+            **self.get_serializer_context(),
+            'max_depth': roots[0].depth + depth - 1 if roots else 0,
+            'depth': depth,
+        })
+        return paginator.get_paginated_response(liked.flag(liked.viewer_id(request.user), serializer.data, 'comment'))
     
-    @action(detail=True, methods=['post'])
-    def unlike(self, request, pk=None):
+    @action(detail=False, methods=['get'])
+    @conditional(lambda view, request: scope_validators('feed'))
+    def stream(self, request):
+        """Every post, newest first, streamed as one JSON array instead of in pages."""
+        posts = Post.objects.order_by(*self.keyset_ordering)
+        return streaming.response(streaming.iter_posts(
+            posts, self.comment_preview_size, self.stream_chunk_size, liked.viewer_id(request.user)
+        ))
+    
+    @action(detail=True, methods=['get'], url_path='comments/stream')
+    @conditional(lambda view, request, pk=None: scope_validators(f'post:{pk}'))
+    def stream_comments(self, request, pk=None):
+        """A post's whole thread, or everything below ``?parent=``, streamed as nested JSON."""
         post = self.get_object()
-        user = User.objects.first()  # Temporary: use first user
-        
-        with transaction.atomic():
+        comments = Comment.objects.filter(post=post)
+        if request.query_params.get('parent'):
             try:
-                like = Like.objects.get(user=user, post=post)
-                like.delete()
-                return Response({'message': 'Post unliked successfully'})
-            except Like.DoesNotExist:
-                return Response({'error': 'Not liked'}, status=status.HTTP_400_BAD_REQUEST)
+                parent_id = int(request.query_params['parent'])
+            except ValueError:
+                return Response({'error': 'parent must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+            parent = Comment.objects.filter(pk=parent_id, post=post).values('path', 'depth').first()
+            if parent is None:
+                raise NotFound('Comment not found')
+            comments = comments.filter(subtree_range(parent['path']), depth__gt=parent['depth'])
+        return streaming.response(streaming.iter_thread(comments, self.stream_chunk_size, liked.viewer_id(request.user)))
 
-class CommentViewSet(viewsets.ModelViewSet):
+class CommentViewSet(LikeActionsMixin, ReplicaReadsMixin, viewsets.ModelViewSet):
     queryset = Comment.objects.all().order_by('created_at')
     serializer_class = CommentSerializer
     permission_classes = [AllowAny]
+    pagination_class = KeysetPagination
+    keyset_ordering = ('created_at', 'id')
+    like_kind = 'comment'
     
     def get_queryset(self):
-        return Comment.objects.select_related('author', 'post').prefetch_related(
-            'comment_likes',
-            Prefetch('replies', queryset=Comment.objects.select_related('author'))
-        )
+        queryset = with_karma(Comment.objects.select_related('post'), 'author')
+        if self.action in ('list', 'retrieve'):
+            # Whole subtrees are loaded by path and linked with build_thread.
+            return queryset
+        return queryset.prefetch_related(Prefetch('replies', queryset=with_karma(Comment.objects.all(), 'author')))
+    
+    @conditional(lambda view, request, *args, **kwargs: scope_validators('feed'))
+    def list(self, request, *args, **kwargs):
+        page = self.paginate_queryset(self.filter_queryset(self.get_queryset()))
+        self.load_subtrees(page)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(liked.flag(liked.viewer_id(request.user), serializer.data, 'comment'))
+    
+    def load_subtrees(self, comments):
+        """Load the replies below ``comments``, at any depth, in one query."""
+        if not comments:
+            return
+        subtrees = Q()
+        for comment in comments:
+            subtrees |= Q(subtree_range(comment.path), post_id=comment.post_id)
+        # Sorted below, so the query needs no ORDER BY.
+        descendants = with_karma(Comment.objects.filter(subtrees), 'author').exclude(
+            pk__in=[comment.pk for comment in comments]
+        ).order_by()
+        build_thread(sorted([*comments, *descendants], key=lambda comment: (comment.post_id, comment.path)))
+    
+    @conditional(lambda view, request, *args, **kwargs: view.comment_validators(kwargs['pk']))
+    def retrieve(self, request, *args, **kwargs):
+        comment = self.get_object()
+        descendants = with_karma(comment.subtree().exclude(pk=comment.pk), 'author')
+        build_thread([comment, *descendants])
+        serializer = self.get_serializer(comment)
+        return Response(liked.flag(liked.viewer_id(request.user), [serializer.data], 'comment')[0])
     
     def perform_create(self, serializer):
         # For now, use first user or create one
@@ -80,42 +280,103 @@ class CommentViewSet(viewsets.ModelViewSet):
             user = User.objects.create_user('testuser', 'test@test.com', 'password')
         serializer.save(author=user)
     
-    @action(detail=True, methods=['post'])
-    def like(self, request, pk=None):
-        comment = self.get_object()
-        user = User.objects.first()  # Temporary: use first user
-        
+    def comment_validators(self, pk):
+        post_id = Comment.objects.filter(pk=pk).values_list('post_id', flat=True).first()
+        if post_id is None:
+            return None
+        return scope_validators(f'post:{post_id}')
+    
+    def perform_destroy(self, instance):
         with transaction.atomic():
-            if Like.objects.filter(user=user, comment=comment).exists():
-                return Response({'error': 'Already liked'}, status=status.HTTP_400_BAD_REQUEST)
-            
-            Like.objects.create(user=user, comment=comment)
-            
-            KarmaTransaction.objects.create(
-                user=comment.author,
-                karma=1,
-                source_type='comment_like',
-                source_id=comment.id
-            )
+            # Replies are removed by the cascade, so the post loses the whole subtree.
+            removed = instance.subtree().count()
+            instance.delete()
+            Post.objects.filter(pk=instance.post_id).update(**ranking.counter_update(comments=-removed))
+            if instance.parent_id:
+                Comment.objects.filter(pk=instance.parent_id).update(replies_count=F('replies_count') - 1)
+
+class LikeViewSet(ReplicaReadsMixin, viewsets.GenericViewSet):
+    serializer_class = LikeBatchSerializer
+    permission_classes = [AllowAny]
+    
+    @action(detail=False, methods=['post'])
+    def batch(self, request):
+        """Apply many likes/unlikes of posts and comments at once."""
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        user = acting_user(request)
         
-        return Response({'message': 'Comment liked successfully'}, status=status.HTTP_201_CREATED)
+        results = apply_batch(user, serializer.validated_data['actions'])
+        return Response({'results': results})
+    
+    @action(detail=False)
+    def queue(self, request):
+        """Write-behind queue depth and flush lag."""
+        return Response(likequeue.metrics())
+
+class ExportViewSet(viewsets.ViewSet):
+    """Admin-only NDJSON dumps of the feed tables, for analytics."""
+    permission_classes = [IsAdminUser]
+    
+    def list(self, request):
+        return Response({'tables': list(export.MODELS)})
+    
+    def retrieve(self, request, pk=None):
+        """Stream one table as NDJSON, gzipped with ``?gzip=1``."""
+        if pk not in export.MODELS:
+            raise NotFound('Unknown table')
+        pieces = export.iter_ndjson(pk)
+        filename = f'{pk}.ndjson'
+        content_type = 'application/x-ndjson'
+        if request.query_params.get('gzip') in ('1', 'true'):
+            pieces = export.gzipped(pieces)
+            filename += '.gz'
+            content_type = 'application/gzip'
+        response = StreamingHttpResponse(pieces, content_type=content_type)
+        response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+class SearchViewSet(ReplicaReadsMixin, viewsets.ViewSet):
+    permission_classes = [AllowAny]
+    
+    def list(self, request):
+        """Posts and comments matching every word of ``?q=``, best match first."""
+        text = request.query_params.get('q', '')
+        if not search.terms(text):
+            return Response({'error': 'q must contain at least one word'}, status=status.HTTP_400_BAD_REQUEST)
+        paginator = SearchPagination()
+        hits = paginator.paginate_search(text, request)
+        return paginator.get_paginated_response(liked.flag(liked.viewer_id(request.user), search.render(hits), 'post'))
 
-class UserViewSet(viewsets.ReadOnlyModelViewSet):
+class UserViewSet(ReplicaReadsMixin, viewsets.ReadOnlyModelViewSet):
     queryset = User.objects.all()
     serializer_class = UserSerializer
     permission_classes = [AllowAny]
+    pagination_class = KeysetPagination
+    keyset_ordering = ('id',)
+    
+    def get_queryset(self):
+        return with_karma(User.objects.all())
     
     @action(detail=False)
+    @conditional(lambda view, request: leaderboard_validators())
     def leaderboard(self, request):
-        twenty_four_hours_ago = timezone.now() - timedelta(hours=24)
-        
-        top_users = User.objects.filter(
-            karma_transactions__created_at__gte=twenty_four_hours_ago
-        ).annotate(
-            daily_karma=Sum('karma_transactions__karma')
-        ).filter(
-            daily_karma__isnull=False
-        ).order_by('-daily_karma')[:5]
+        top_ids = top_user_ids()
+        users = {user.id: user for user in with_karma(User.objects.filter(id__in=top_ids))}
+        top_users = [users[user_id] for user_id in top_ids if user_id in users]
         
         serializer = self.get_serializer(top_users, many=True)
         return Response(serializer.data)
+
+
+@require_safe
+def event_stream(request):
+    """Server-sent events for ``?channel=feed``, ``leaderboard`` or ``post:<id>``.
+
+    Under WSGI every open stream holds a worker thread; serve many
+    subscribers from ``/api/async/events/`` on an ASGI worker.
+    """
+    channels = events.requested_channels(request.GET)
+    if channels is None:
+        return JsonResponse({'error': 'channel must be feed, leaderboard or post:<id>'}, status=400)
+    return events.response(events.stream(channels))